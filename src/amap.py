@@ -1,16 +1,23 @@
 import requests
 import folium
+import numpy as np
 from folium.plugins import MiniMap, Fullscreen
 from typing import Dict, List, Tuple, Optional
 from PIL import Image
-import selenium
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-import time
-import tempfile
 import base64
 import io
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils"))
+from cache_store import geo_cached
+from batch_geocoder import batch_geocode, rate_limited
+import route_geometry
+import route_cache
+import browser_pool
+import static_map
+import tile_cache
+import http_client
 
 # 高德地图API配置
 AMAP_API_KEY = ""  # 将在travel.py中设置
@@ -39,6 +46,8 @@ def calculate_poi_score(poi, priority_type, poi_priorities):
     
     return score
 
+@geo_cached("search_poi")
+@rate_limited(lambda: AMAP_API_KEY)
 def search_poi(keyword):
     """使用高德POI搜索API将关键词转换为地址"""
     url = "https://restapi.amap.com/v3/place/text"
@@ -50,7 +59,7 @@ def search_poi(keyword):
         "extensions": "all"
     }
     try:
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params)
         data = response.json()
         if data["status"] == "1" and data["pois"]:
             # 0528最新修改：优化景点类型优先级排序
@@ -104,6 +113,8 @@ def search_poi(keyword):
         print(f"POI搜索失败: {e}")
         return None
 
+@geo_cached("geocode_address", is_valid=lambda r: r[0] is not None, restore=tuple)
+@rate_limited(lambda: AMAP_API_KEY)
 def geocode_address(address):
     """使用高德地图API将地址转换为经纬度"""
     url = "https://restapi.amap.com/v3/geocode/geo"
@@ -113,7 +124,7 @@ def geocode_address(address):
         "output": "json"
     }
     try:
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params)
         data = response.json()
         if data["status"] == "1" and data["geocodes"]:
             location = data["geocodes"][0]["location"]
@@ -129,6 +140,8 @@ def geocode_address(address):
         print(f"地址解析错误: {e}")
         return None, None, f"地址解析错误: {str(e)}"
 
+@geo_cached("geocode_location", restore=tuple)
+@rate_limited(lambda: AMAP_API_KEY)
 def geocode_location(location_name: str) -> Optional[Tuple[float, float]]:
     """地理编码：将地名转换为经纬度"""
     url = "https://restapi.amap.com/v3/geocode/geo"
@@ -139,7 +152,7 @@ def geocode_location(location_name: str) -> Optional[Tuple[float, float]]:
     }
     
     try:
-        response = requests.get(url, params=params, timeout=5)
+        response = http_client.get(url, params=params, timeout=5)
         data = response.json()
         
         if data.get("status") == "1" and int(data.get("count", 0)) > 0:
@@ -150,6 +163,7 @@ def geocode_location(location_name: str) -> Optional[Tuple[float, float]]:
     except:
         return None
 
+@rate_limited(lambda: (AMAP_API_KEY, "direction"))
 def calculate_driving_route(
     start_lng: float, start_lat: float, 
     end_lng: float, end_lat: float
@@ -165,7 +179,7 @@ def calculate_driving_route(
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get(url, params=params, timeout=10)
         data = response.json()
         
         # 检查API状态
@@ -214,6 +228,7 @@ def calculate_driving_route(
     except Exception as e:
         return {"success": False, "error": f"请求异常: {str(e)}"}
 
+@rate_limited(lambda: (AMAP_API_KEY, "direction"))
 def calculate_transit_route(
     start_lng: float, start_lat: float, 
     end_lng: float, end_lat: float,
@@ -231,7 +246,7 @@ def calculate_transit_route(
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get(url, params=params, timeout=10)
         data = response.json()
         
         if data.get("status") != "1":
@@ -291,6 +306,7 @@ def calculate_transit_route(
     except Exception as e:
         return {"success": False, "error": f"公交路线请求异常: {str(e)}"}
 
+@rate_limited(lambda: (AMAP_API_KEY, "direction"))
 def calculate_walking_route(
     start_lng: float, start_lat: float, 
     end_lng: float, end_lat: float
@@ -305,7 +321,7 @@ def calculate_walking_route(
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get(url, params=params, timeout=10)
         data = response.json()
         
         if data.get("status") != "1":
@@ -338,55 +354,53 @@ def calculate_walking_route(
     except Exception as e:
         return {"success": False, "error": f"步行路线请求异常: {str(e)}"}
 
-def decode_polyline(polyline_str: str) -> List[List[float]]:
-    """解码高德地图的polyline字符串为坐标点列表 - 关键修复"""
-    if not polyline_str:
-        print("空polyline字符串")
-        return []
-    
-    points = []
-    
-    # 处理多段polyline（用分号分隔）
-    segments = polyline_str.split(';')
-    print(f"解码polyline: 分段数量={len(segments)}")
-    
-    for segment in segments:
-        if not segment.strip():
-            continue
-            
-        # 处理每个分段中的坐标对（用空格或逗号分隔）
-        coordinate_pairs = segment.replace(',', ' ').split()
-        
-        # 每两个数字组成一个坐标对
-        for i in range(0, len(coordinate_pairs) - 1, 2):
-            try:
-                lng = float(coordinate_pairs[i])
-                lat = float(coordinate_pairs[i + 1])
-                # Folium使用[纬度,经度]顺序
-                points.append([lat, lng])
-            except (ValueError, IndexError) as e:
-                print(f"解析坐标对失败: {coordinate_pairs[i:i+2]}, 错误: {e}")
-                continue
-    
-    # 如果上面的方法没有成功，尝试另一种解析方式
-    if not points:
-        print("尝试备用解析方法...")
-        # 尝试直接按逗号分割的方式
-        coords = polyline_str.replace(';', ',').split(',')
-        for i in range(0, len(coords) - 1, 2):
-            try:
-                lng = float(coords[i].strip())
-                lat = float(coords[i + 1].strip())
-                points.append([lat, lng])
-            except (ValueError, IndexError):
-                continue
-    
-    print(f"解码后坐标点数量: {len(points)}")
-    if points:
-        print(f"第一个点: 纬度={points[0][0]:.6f}, 经度={points[0][1]:.6f}")
-        print(f"最后一个点: 纬度={points[-1][0]:.6f}, 经度={points[-1][1]:.6f}")
-    
-    return points
+def calculate_multi_leg_route(
+    stops: List[Tuple[float, float]],
+    names: Optional[List[str]] = None,
+    max_workers: Optional[int] = None
+) -> Dict[str, any]:
+    """
+    多途经点驾车路线：各段并发计算（带路线缓存），合并为一条路线
+    :param stops: [(经度, 纬度), ...]，至少两个
+    :param names: 各途经点名称，用于地图标记
+    :return: 与单段结果相同的字段（distance/duration 为各段之和，polyline 为各段拼接），
+             另含 legs（各段结果）和 waypoints（[(经度, 纬度, 名称), ...]）
+    """
+    if len(stops) < 2:
+        return {"success": False, "error": "至少需要两个地点才能规划路线"}
+    names = names or [f"第{i + 1}站" for i in range(len(stops))]
+    legs = route_cache.map_legs(
+        lambda a, b: route_cache.get_route("driving", a, b, calculate_driving_route),
+        stops, max_workers
+    )
+    ok_legs = [leg for leg in legs if leg.get("success")]
+    if not ok_legs:
+        return {"success": False, "error": legs[0].get("error", "所有路段规划失败")}
+    failed = len(legs) - len(ok_legs)
+    if failed:
+        print(f"多段路线: {failed}/{len(legs)} 段规划失败，已跳过")
+
+    map_points = [p for leg in ok_legs for p in leg.get("map_points", [])]
+    zoom = route_geometry.zoom_for_extent(np.asarray(map_points)) if map_points else 13
+    return {
+        "success": True,
+        "distance": sum(leg.get("distance", 0) for leg in ok_legs),
+        "duration": sum(leg.get("duration", 0) for leg in ok_legs),
+        "polyline": ";".join(leg["polyline"] for leg in ok_legs if leg.get("polyline")),
+        "map_points": route_geometry.simplify_polyline(
+            map_points, zoom + route_geometry.SIMPLIFY_ZOOM_MARGIN).tolist() if map_points else [],
+        "map_zoom": zoom,
+        "origin": f"{stops[0][0]},{stops[0][1]}",
+        "destination": f"{stops[-1][0]},{stops[-1][1]}",
+        "origin_name": names[0],
+        "destination_name": names[-1],
+        "legs": legs,
+        "waypoints": [(lng, lat, name) for (lng, lat), name in zip(stops, names)],
+    }
+
+def decode_polyline(polyline_str: str) -> np.ndarray:
+    """解码高德地图的polyline字符串为 (N, 2) 坐标数组，每行为 [纬度, 经度]"""
+    return route_geometry.decode_polyline(polyline_str)
 
 def create_map_html(result: Dict, route_type: str) -> str:
     """创建路线可视化地图并返回HTML字符串 - 关键修复"""
@@ -417,41 +431,29 @@ def create_map_html(result: Dict, route_type: str) -> str:
         print(f"解析起点终点坐标失败: {e}")
         return f"<div style='color:red; padding:20px; text-align:center;'>坐标解析失败: {str(e)}</div>"
     
-    # 解码路线坐标
-    points = []
-    if "polyline" in result and result["polyline"]:
-        print(f"开始解码polyline: {result['polyline'][:100]}...")
-        points = decode_polyline(result["polyline"])
+    # 解码并按缩放级别简化路线坐标（路线缓存中已带有简化结果时直接使用）
+    if result.get("map_points"):
+        points = np.asarray(result["map_points"], dtype=np.float64)
+        zoom = result.get("map_zoom") or route_geometry.zoom_for_extent(points)
+    else:
+        points, zoom = route_geometry.prepare_map_points(result.get("polyline", ""))
     
     # 如果没有路线坐标，使用起点终点连线
-    if not points:
+    if len(points) < 2:
         print("使用起点终点连线作为路径")
-        points = [[start_lat, start_lng], [end_lat, end_lng]]
+        points = np.array([[start_lat, start_lng], [end_lat, end_lng]])
+        zoom = route_geometry.zoom_for_extent(points)
+    print(f"路线坐标点数量: {len(points)}")
     
-    # 计算地图中心点和缩放级别
-    if len(points) >= 2:
-        center_lat = sum(point[0] for point in points) / len(points)
-        center_lng = sum(point[1] for point in points) / len(points)
-        
-        # 计算坐标范围以确定合适的缩放级别
-        lat_range = max(point[0] for point in points) - min(point[0] for point in points)
-        lng_range = max(point[1] for point in points) - min(point[1] for point in points)
-        max_range = max(lat_range, lng_range)
-        
-        if max_range > 1:
-            zoom = 8
-        elif max_range > 0.1:
-            zoom = 10
-        elif max_range > 0.01:
-            zoom = 13
-        else:
-            zoom = 15
-    else:
-        center_lat, center_lng = start_lat, start_lng
-        zoom = 13
+    # 地图中心取路线外接矩形中心
+    center_lat, center_lng = map(float, (points.min(axis=0) + points.max(axis=0)) / 2)
     
     print(f"地图中心: 纬度={center_lat:.6f}, 经度={center_lng:.6f}, 缩放={zoom}")
     
+    # 代理启用时在后台预取路线范围内的瓦片，用户放大查看时直接命中本地缓存
+    if tile_cache.proxy_enabled():
+        tile_cache.prefetch_async(points, range(zoom, min(zoom + route_geometry.SIMPLIFY_ZOOM_MARGIN, 18) + 1))
+    
     # 创建地图
     try:
         # 使用高德地图瓦片
@@ -463,7 +465,7 @@ def create_map_html(result: Dict, route_type: str) -> str:
         
         # 添加高德地图瓦片层
         folium.TileLayer(
-            tiles='https://webrd02.is.autonavi.com/appmaptile?lang=zh_cn&size=1&scale=1&style=8&x={x}&y={y}&z={z}',
+            tiles=tile_cache.tile_url_template(),
             attr='高德地图',
             name='高德地图',
             overlay=False,
@@ -494,10 +496,22 @@ def create_map_html(result: Dict, route_type: str) -> str:
             start_icon = "male"
             start_color = "orange"
         
-        # 添加路线折线
-        if len(points) > 1:
+        # 添加路线折线（多段路线逐段绘制，颜色交替便于区分）
+        legs = [leg for leg in result.get("legs", []) if leg.get("success") and leg.get("map_points")]
+        if legs:
+            palette = [color, '#FA8C16', '#722ED1', '#13C2C2']
+            for i, leg in enumerate(legs):
+                folium.PolyLine(
+                    locations=leg["map_points"],
+                    color=palette[i % len(palette)],
+                    weight=5,
+                    opacity=0.8,
+                    tooltip=f"{tooltip} 第{i + 1}段"
+                ).add_to(m)
+            print(f"多段路线添加成功，段数: {len(legs)}")
+        elif len(points) > 1:
             folium.PolyLine(
-                locations=points,
+                locations=points.tolist(),
                 color=color,
                 weight=5,
                 opacity=0.8,
@@ -505,6 +519,15 @@ def create_map_html(result: Dict, route_type: str) -> str:
             ).add_to(m)
             print(f"路线添加成功，坐标点数量: {len(points)}")
         
+        # 添加途经点标记（首尾由起点终点标记表示）
+        for i, (lng, lat, name) in enumerate(result.get("waypoints", [])[1:-1], 2):
+            folium.Marker(
+                location=[lat, lng],
+                popup=f"📍 {name}",
+                icon=folium.Icon(color="cadetblue", icon="map-marker", prefix='fa'),
+                tooltip=f"第{i}站"
+            ).add_to(m)
+        
         # 添加起点标记
         folium.Marker(
             location=[start_lat, start_lng],
@@ -591,66 +614,88 @@ def create_map_html(result: Dict, route_type: str) -> str:
         """
         return error_html
 
-def save_map_as_image(result: Dict, route_type: str = "driving") -> str:
-    """将地图保存为JPG图片并返回base64编码"""
-    try:
-        # 创建临时HTML文件
-        map_html = create_map_html(result, route_type)
-        
-        # 使用Selenium截图（需要安装Chrome浏览器和ChromeDriver）
-        # 注意：在实际部署时确保Chrome和ChromeDriver可用
-        options = Options()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--window-size=1200,800')
-        
-        # 创建临时HTML文件
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False) as f:
-            f.write(f"""
+MAP_PLACEHOLDER_IMAGE = "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwCdABmX/9k="
+
+# 路线图片生成方式：browser（无头浏览器截图，Chrome 不可用时退回离线绘制）或 offline（Pillow 离线绘制，
+# 只用本地已缓存的瓦片，未缓存的区域只有网格底图）
+MAP_IMAGE_BACKEND = os.getenv("MAP_IMAGE_BACKEND", "browser").lower()
+
+def warm_map_renderer():
+    """应用启动时在后台预热浏览器池（仅浏览器截图方式），首次生成路线图不再等待 Chrome 启动"""
+    if MAP_IMAGE_BACKEND == "browser":
+        browser_pool.warm_async()
+
+def _browser_ready() -> bool:
+    """是否使用浏览器截图：已选择浏览器方式，且浏览器最近没有启动失败"""
+    return MAP_IMAGE_BACKEND == "browser" and browser_pool.get_pool().available()
+
+def _map_page(map_html: str) -> str:
+    # 瓦片走本进程代理时页面里是相对路径，截图用的临时文件需要指定基准地址
+    base = f'<base href="{tile_cache.proxy_base_url()}/">' if tile_cache.proxy_enabled() else ""
+    return f"""
             <!DOCTYPE html>
             <html>
             <head>
                 <meta charset="utf-8">
+                {base}
                 <title>Route Map</title>
             </head>
             <body style="margin:0; padding:20px; background:#f5f5f5;">
                 {map_html}
             </body>
             </html>
-            """)
-            temp_file = f.name
+            """
+
+def save_map_as_image(result: Dict, route_type: str = "driving") -> str:
+    """
+    将地图保存为JPG图片并返回base64编码
+    默认用常驻浏览器池截图，Chrome 不可用（启动或截图失败）时退回离线绘制；
+    浏览器启动失败后的一段时间内（BROWSER_RETRY_AFTER）直接离线绘制，不再反复尝试启动；
+    MAP_IMAGE_BACKEND=offline 时直接离线绘制（本地瓦片 + Pillow，无需浏览器）
+    """
+    if not _browser_ready():
+        return render_map_image(result, route_type)
+    try:
+        map_html = create_map_html(result, route_type)
         
-        try:
-            # 注意：这部分代码需要系统安装Chrome浏览器和ChromeDriver
-            # 在Gradio环境中可能无法直接使用，建议使用其他截图方案
-            driver = webdriver.Chrome(options=options)
-            driver.get(f"file://{temp_file}")
-            time.sleep(3)  # 等待地图加载
-            
-            # 截图并保存
-            screenshot = driver.get_screenshot_as_png()
-            driver.quit()
-            
-            # 转换为JPG格式
-            img = Image.open(io.BytesIO(screenshot))
-            img_rgb = img.convert('RGB')
-            
-            # 保存为base64
-            buffer = io.BytesIO()
-            img_rgb.save(buffer, format='JPEG', quality=95)
-            img_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            return f"data:image/jpeg;base64,{img_base64}"
-            
-        finally:
-            # 清理临时文件
-            os.unlink(temp_file)
+        # 注意：需要系统安装Chrome浏览器和ChromeDriver，不可用时返回占位图片
+        screenshot = browser_pool.get_pool().screenshot_html(_map_page(map_html))
+        
+        # 转换为JPG格式
+        img = Image.open(io.BytesIO(screenshot))
+        img_rgb = img.convert('RGB')
+        
+        # 保存为base64
+        buffer = io.BytesIO()
+        img_rgb.save(buffer, format='JPEG', quality=95)
+        img_base64 = base64.b64encode(buffer.getvalue()).decode()
+        
+        return f"data:image/jpeg;base64,{img_base64}"
             
     except Exception as e:
-        print(f"地图截图失败: {e}")
-        # 返回一个占位图片的base64编码
-        return "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDAAYEBQYFBAYGBQYHBwYIChAKCgkJChQODwwQFxQYGBcUFhYaHSUfGhsjHBYWICwgIyYnKSopGR8tMC0oMCUoKSj/2wBDAQcHBwoIChMKChMoGhYaKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCgoKCj/wAARCAABAAEDASIAAhEBAxEB/8QAFQABAQAAAAAAAAAAAAAAAAAAAAv/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFQEBAQAAAAAAAAAAAAAAAAAAAAX/xAAUEQEAAAAAAAAAAAAAAAAAAAAA/9oADAMBAAIRAxEAPwCdABmX/9k="
+        print(f"地图截图失败，改用离线绘制: {e}")
+        return render_map_image(result, route_type)
+
+def render_map_image(result: Dict, route_type: str = "driving") -> str:
+    """离线绘制路线图并返回JPG的base64编码，失败时返回占位图片"""
+    if not result.get("success"):
+        return MAP_PLACEHOLDER_IMAGE
+    try:
+        return static_map.route_image_base64(result, route_type)
+    except Exception as e:
+        print(f"离线绘制地图失败: {e}")
+        return MAP_PLACEHOLDER_IMAGE
+
+def save_maps_as_images(results: List[Dict], route_type: str = "driving") -> List[str]:
+    """并发生成多张地图图片（浏览器截图时并发数即浏览器池大小），按输入顺序返回base64图片"""
+    from concurrent.futures import ThreadPoolExecutor
+    if not results:
+        return []
+    if not _browser_ready():
+        return [render_map_image(r, route_type) for r in results]
+    workers = min(browser_pool.get_pool().size, len(results))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda r: save_map_as_image(r, route_type), results))
 
 def process_route(start: str, end: str, route_type: str):
     """处理路线规划请求并生成地图和路线信息 - 关键修复"""
@@ -664,8 +709,8 @@ def process_route(start: str, end: str, route_type: str):
     
     # 地理编码获取坐标
     print("开始地理编码...")
-    start_coords = geocode_location(start)
-    end_coords = geocode_location(end)
+    # 起点和终点并发解析
+    start_coords, end_coords = batch_geocode(geocode_location, [start, end])
 
     if not start_coords or not end_coords:
         error_msg = f"地址解析失败: 起点={start_coords}, 终点={end_coords}"
@@ -678,19 +723,19 @@ def process_route(start: str, end: str, route_type: str):
     try:
         if route_type in ["驾车", "driving"]:
             print("计算驾车路线...")
-            result = calculate_driving_route(*start_coords, *end_coords)
+            result = route_cache.get_route("driving", start_coords, end_coords, calculate_driving_route)
             result["origin_name"] = start
             result["destination_name"] = end
         elif route_type in ["公交", "transit"]:
             print("计算公交路线...")
             # 提取城市信息用于公交查询
             city = start.split()[0] if ' ' in start else "北京"  # 简单提取城市
-            result = calculate_transit_route(*start_coords, *end_coords, city)
+            result = route_cache.get_route("transit", start_coords, end_coords, calculate_transit_route, city)
             result["origin_name"] = start
             result["destination_name"] = end
         elif route_type in ["步行", "walking"]:
             print("计算步行路线...")
-            result = calculate_walking_route(*start_coords, *end_coords)
+            result = route_cache.get_route("walking", start_coords, end_coords, calculate_walking_route)
             result["origin_name"] = start
             result["destination_name"] = end
         else:
@@ -0,0 +1,138 @@
+import os
+import csv
+import functools
+from collections import deque
+
+# 查询结果缓存条数上限（按最近使用淘汰）
+AIRPORT_MEMO_SIZE = int(os.getenv("AIRPORT_MEMO_SIZE", 4096))
+
+
+def load_airport_rows(filepath):
+    """
+    按CSV顺序读取机场三字码表，返回 [{"code", "airport", "english", "short", "city"}, ...]
+    """
+    rows = []
+    if not os.path.exists(filepath):
+        print(f"机场三字码文件不存在: {filepath}")
+        return rows
+    with open(filepath, "r", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            rows.append({
+                "code": row.get("机场三字码", "").strip().upper(),
+                "airport": row.get("机场名称", "").strip(),
+                "english": row.get("机场英文名", "").strip(),
+                "short": row.get("机场简称", "").strip(),
+                "city": row.get("城市名称", "").strip(),
+            })
+    return rows
+
+
+class AhoCorasick:
+    """多模式串匹配自动机：一次扫描找出文本中出现的所有模式串"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pid, pattern in enumerate(patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(pid)
+        # 广度优先构建失败指针，并合并输出
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def find(self, text):
+        """返回文本中出现的模式串编号集合"""
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(ch, 0)
+            if self.out[node]:
+                found.update(self.out[node])
+        return found
+
+
+class AirportIndex:
+    """
+    机场三字码索引
+    - 精确匹配：三字码集合 + 名称（机场名称、简称、城市名称）哈希表（同名时以 CSV 中靠后的行为准，与原映射一致）
+    - 子串匹配：所有名称构建 Aho-Corasick 自动机，找出查询文本中包含的全部名称
+    排序规则固定：精确匹配优先，其次名称越长越优先（如“虹桥国际机场”优于“上海”），再按 CSV 行号
+    """
+
+    def __init__(self, rows):
+        """:param rows: [{"code", "airport", "short", "city"}, ...]，按 CSV 顺序"""
+        self.codes = set()
+        self.name_to_code = {}
+        self.name_order = {}
+        for row in rows:
+            code = row.get("code", "")
+            if not code:
+                continue
+            self.codes.add(code)
+            for field in ("city", "airport", "short"):
+                name = row.get(field, "")
+                if name:
+                    self.name_to_code[name] = code
+                    self.name_order.setdefault(name, len(self.name_order))
+        self.names = sorted(self.name_order, key=self.name_order.get)
+        self.matcher = AhoCorasick(self.names)
+        # 索引构建后只读，查询结果可直接缓存（LRU 限长，避免任意用户输入使内存无限增长）
+        self.resolve = functools.lru_cache(maxsize=AIRPORT_MEMO_SIZE)(self._resolve)
+
+    @staticmethod
+    def _variants(target):
+        """与原查找逻辑一致的查询变体：补全/去掉“机场”，去掉“国际”"""
+        variants = [target]
+        if target.endswith("机场"):
+            variants.append(target[:-2])
+        else:
+            variants.append(target + "机场")
+        if "国际" in target:
+            variants.append(target.replace("国际", ""))
+        return variants
+
+    def candidates(self, target):
+        """返回按排序规则排列的 [(三字码, 匹配名称), ...]"""
+        target = (target or "").strip()
+        if not target:
+            return []
+        if target.upper() in self.codes:
+            return [(target.upper(), target.upper())]
+        variants = self._variants(target)
+        exact = {v for v in variants if v in self.name_to_code}
+        matched = set()
+        for v in variants:
+            matched.update(self.matcher.find(v))
+        names = exact | {self.names[pid] for pid in matched}
+        ranked = sorted(names, key=lambda n: (n not in exact, -len(n), self.name_order[n]))
+        return [(self.name_to_code[n], n) for n in ranked]
+
+    def _resolve(self, target):
+        """返回最佳匹配的三字码，找不到返回空字符串（通过实例上带缓存的 resolve 调用）"""
+        found = self.candidates(target)
+        return found[0][0] if found else ""
+
+    def resolve_many(self, targets):
+        """批量解析，按输入顺序返回三字码列表"""
+        return [self.resolve(t) for t in targets]
@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from cache_store import TTLCache
+
+# 文档问答答案缓存配置（可通过环境变量覆盖）
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 6 * 3600))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 512))
+# 查询向量余弦相似度不低于该值时视为同一问题。默认不启用语义匹配，只按归一化后的查询文本精确匹配：
+# bge-small-zh 的余弦相似度整体集中在高分段，“北京美食”与“上海美食”这类只差城市名的问题得分也很高，
+# 固定阈值会把一个城市的问题命中另一个城市的答案。需要时先用标注过的问题对评估出阈值再设置
+_threshold = os.getenv("ANSWER_CACHE_THRESHOLD", "").strip()
+ANSWER_CACHE_THRESHOLD = float(_threshold) if _threshold else None
+# 命中时回放的每段字符数
+REPLAY_CHUNK_CHARS = 16
+
+_PUNCT_RE = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_query(query):
+    """查询归一化：全角转半角、转小写、去掉空白和标点"""
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    return _PUNCT_RE.sub("", text)
+
+
+def replay(answer, chunk_chars=REPLAY_CHUNK_CHARS):
+    """把缓存的完整答案按段 yield，保持与流式输出一致的界面行为"""
+    for i in range(0, len(answer), chunk_chars):
+        yield answer[i:i + chunk_chars]
+
+
+class SemanticAnswerCache:
+    """
+    两级匹配的答案缓存：
+    1. 归一化后的查询文本精确匹配
+    2. 查询向量与已缓存查询的余弦相似度不低于 threshold（threshold 为 None 时不启用，见 ANSWER_CACHE_THRESHOLD）
+    """
+
+    def __init__(self, embedder=None, ttl=ANSWER_CACHE_TTL, max_items=ANSWER_CACHE_SIZE,
+                 threshold=ANSWER_CACHE_THRESHOLD):
+        self.embedder = embedder
+        self.ttl = ttl
+        self.threshold = threshold
+        self.exact = TTLCache(max_items=max_items, ttl=ttl)
+        self._lock = threading.Lock()
+        self._keys = []        # 与 _vectors 行对应的归一化查询
+        self._vectors = None   # (N, dim) 已归一化的查询向量
+        self.semantic_hits = 0
+
+    def _embed(self, query):
+        if self.embedder is None or self.threshold is None:
+            return None
+        try:
+            vec = np.asarray(self.embedder.embed_query(query), dtype=np.float32)
+        except Exception as e:
+            print(f"答案缓存嵌入查询失败: {e}")
+            return None
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+
+    def get(self, query):
+        """返回缓存的答案，未命中返回 None"""
+        key = normalize_query(query)
+        if not key:
+            return None
+        hit, answer = self.exact.get(key)
+        if hit:
+            return answer
+        vec = self._embed(query)
+        if vec is None:
+            return None
+        with self._lock:
+            if self._vectors is None or not len(self._keys):
+                return None
+            sims = self._vectors @ vec
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                return None
+            best_key = self._keys[best]
+        hit, answer = self.exact.get(best_key)
+        if not hit:
+            # 已过期或被淘汰，顺带清理向量
+            self._forget(best_key)
+            return None
+        self.semantic_hits += 1
+        return answer
+
+    def set(self, query, answer):
+        key = normalize_query(query)
+        if not key or not answer:
+            return
+        self.exact.set(key, answer, self.ttl)
+        vec = self._embed(query)
+        if vec is None:
+            return
+        with self._lock:
+            if key in self._keys:
+                return
+            self._keys.append(key)
+            row = vec.reshape(1, -1)
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            # 向量表与精确缓存同步限长，淘汰最早加入的查询
+            overflow = len(self._keys) - self.exact.max_items
+            if overflow > 0:
+                self._keys = self._keys[overflow:]
+                self._vectors = self._vectors[overflow:]
+
+    def _forget(self, key):
+        with self._lock:
+            if key in self._keys:
+                idx = self._keys.index(key)
+                del self._keys[idx]
+                self._vectors = np.delete(self._vectors, idx, axis=0)
+
+    def stats(self):
+        stats = self.exact.stats()
+        stats["semantic_hits"] = self.semantic_hits
+        return stats
@@ -2,6 +2,10 @@ import requests
 import re
 from flask import Flask, request, jsonify, render_template
 import os
+from cache_store import geo_cached
+from batch_geocoder import batch_geocode, rate_limited
+from route_cache import map_legs
+import http_client
 
 app = Flask(__name__)
 
@@ -58,6 +62,8 @@ def extract_addresses_from_text(text):
     
     return unique_addresses
 
+@geo_cached("get_coordinates")
+@rate_limited(lambda: API_KEY)
 def get_coordinates(address):
     """
     通过高德地图地理编码API将地址转换为经纬度坐标
@@ -69,7 +75,7 @@ def get_coordinates(address):
     }
     
     try:
-        response = requests.get(GEO_URL, params=params, timeout=10)  # 发送GET请求，设置超时
+        response = http_client.get(GEO_URL, params=params, timeout=10)  # 发送GET请求，设置超时
         data = response.json()
         
         # 检查API返回状态：status为'1'表示成功，count不为'0'表示有结果
@@ -88,6 +94,7 @@ def get_coordinates(address):
         print(f"坐标转换错误: {e}")
         return None
 
+@rate_limited(lambda: (API_KEY, "direction"))
 def get_route(origin, destination):
     """
     通过高德地图路径规划API获取从起始地到目的地的路线信息
@@ -101,7 +108,7 @@ def get_route(origin, destination):
     }
     
     try:
-        response = requests.get(ROUTE_URL, params=params, timeout=15)  # 发送GET请求
+        response = http_client.get(ROUTE_URL, params=params, timeout=15)  # 发送GET请求
         data = response.json()
         
         # 检查API返回状态：status为'1'表示成功
@@ -127,14 +134,14 @@ def calculate_multi_point_route(coordinates_list):
     if len(coordinates_list) < 2:
         return []
     
+    # 相邻两点间的路线并发计算，结果保持途经顺序
+    legs = map_legs(get_route, coordinates_list)
     routes = []
-    # 计算相邻两点间的路线
-    for i in range(len(coordinates_list) - 1):
-        route = get_route(coordinates_list[i], coordinates_list[i + 1])
+    for origin, destination, route in zip(coordinates_list[:-1], coordinates_list[1:], legs):
         if route:
             routes.append({
-                'from': coordinates_list[i],
-                'to': coordinates_list[i + 1],
+                'from': origin,
+                'to': destination,
                 'route_data': route
             })
     
@@ -168,8 +175,7 @@ def extract_and_plan_route():
         
         # 2. 将地址转换为坐标
         locations = []
-        for address in addresses:
-            coords = get_coordinates(address)
+        for address, coords in zip(addresses, batch_geocode(get_coordinates, addresses)):
             if coords:
                 locations.append({
                     'name': address,
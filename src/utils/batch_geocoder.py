@@ -0,0 +1,80 @@
+import os
+import time
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# 高德 Web 服务按 Key 限流（个人开发者默认 3 次/秒），超出会返回 CUQPS_HAS_EXCEEDED_THE_LIMIT
+AMAP_QPS = float(os.getenv("AMAP_QPS", 3))
+AMAP_BURST = int(os.getenv("AMAP_BURST", 3))
+# 批量地理编码的最大并发数
+GEO_BATCH_WORKERS = int(os.getenv("GEO_BATCH_WORKERS", 8))
+
+
+class RateLimiter:
+    """线程安全的令牌桶：平均每秒 rate 次，最多允许 burst 次突发"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = max(1, burst or int(rate) or 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，必要时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(key, rate=AMAP_QPS, burst=AMAP_BURST):
+    """按 key（如 API Key）取得共享的限流器，同一个 Key 的所有调用共用一个令牌桶"""
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(rate, burst)
+        return limiter
+
+
+def rate_limited(key_func, rate=AMAP_QPS, burst=AMAP_BURST):
+    """
+    限流装饰器：每次调用前从 key_func() 对应的令牌桶取令牌
+    放在缓存装饰器下方使用，缓存命中不消耗配额
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            get_limiter(key_func(), rate, burst).acquire()
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def batch_geocode(geocode, addresses, max_workers=None):
+    """
+    并发解析一组地址，按输入顺序返回结果（重复地址只请求一次）
+    :param geocode: 单个地址的解析函数，如 amap.geocode_address
+    :param addresses: 地址列表
+    """
+    unique = list(dict.fromkeys(addresses))
+    if not unique:
+        return []
+    workers = min(max_workers or GEO_BATCH_WORKERS, len(unique))
+    if workers <= 1:
+        results = {addr: geocode(addr) for addr in unique}
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = dict(zip(unique, pool.map(geocode, unique)))
+    return [results[addr] for addr in addresses]
@@ -0,0 +1,178 @@
+import os
+import time
+import queue
+import atexit
+import tempfile
+import threading
+import contextlib
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+
+# 常驻无头浏览器数量（同时也是地图截图的最大并发数）
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", 2))
+# 单个浏览器截图多少次后重启，避免长时间运行内存膨胀
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", 50))
+# 等待地图瓦片加载完成的最长时间（秒），超时后按当前画面截图
+MAP_RENDER_TIMEOUT = float(os.getenv("MAP_RENDER_TIMEOUT", 10))
+BROWSER_WINDOW_SIZE = os.getenv("BROWSER_WINDOW_SIZE", "1200,800")
+# 浏览器启动失败（如未安装 Chrome/ChromeDriver）后，多长时间内不再尝试启动（秒）
+BROWSER_RETRY_AFTER = float(os.getenv("BROWSER_RETRY_AFTER", 600))
+
+# 页面（含 Folium 生成的 iframe）中所有 Leaflet 瓦片都带上 leaflet-tile-loaded 类时视为加载完成，
+# 与 TileLayer 的 load 事件条件一致
+TILES_LOADED_JS = """
+if (document.readyState !== 'complete') { return false; }
+var docs = [document];
+document.querySelectorAll('iframe').forEach(function (f) {
+    try { if (f.contentDocument) { docs.push(f.contentDocument); } } catch (e) {}
+});
+var total = 0, pending = 0;
+docs.forEach(function (d) {
+    if (d.readyState !== 'complete') { pending++; }
+    d.querySelectorAll('img.leaflet-tile').forEach(function (t) {
+        total++;
+        if (!t.classList.contains('leaflet-tile-loaded')) { pending++; }
+    });
+});
+return total > 0 && pending === 0;
+"""
+
+
+def _chrome_options():
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument(f'--window-size={BROWSER_WINDOW_SIZE}')
+    return options
+
+
+class BrowserPool:
+    """
+    有上限的无头 Chrome 池：浏览器按需启动后常驻复用，最多 size 个
+    出错的浏览器直接丢弃，下次取用时重新启动
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES):
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._all = set()
+        self._uses = {}
+        self._unavailable_until = 0.0
+
+    def available(self):
+        """最近一次启动失败后 BROWSER_RETRY_AFTER 秒内返回 False，调用方应直接改用其他方式"""
+        return time.monotonic() >= self._unavailable_until
+
+    def _start(self):
+        try:
+            driver = webdriver.Chrome(options=_chrome_options())
+        except WebDriverException:
+            self._unavailable_until = time.monotonic() + BROWSER_RETRY_AFTER
+            raise
+        self._unavailable_until = 0.0
+        with self._lock:
+            self._all.add(driver)
+            self._uses[driver] = 0
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._all.discard(driver)
+            self._uses.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def warm(self, count=None):
+        """预先启动浏览器，避免首次截图承担启动耗时（启动期间占用名额，与截图并发时也不超过 size 个）"""
+        count = min(count or self.size, self.size)
+        try:
+            while len(self._all) < count and self._slots.acquire(blocking=False):
+                try:
+                    self._idle.put(self._start())
+                finally:
+                    self._slots.release()
+        except WebDriverException as e:
+            print(f"预热浏览器失败: {e}")
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """取得一个浏览器，用完自动归还；池满时阻塞等待"""
+        self._slots.acquire()
+        driver = None
+        try:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._start()
+            yield driver
+        except WebDriverException:
+            if driver is not None:
+                self._discard(driver)
+                driver = None
+            raise
+        finally:
+            if driver is not None:
+                with self._lock:
+                    self._uses[driver] = self._uses.get(driver, 0) + 1
+                    worn_out = self._uses[driver] >= self.max_uses
+                if worn_out:
+                    self._discard(driver)
+                else:
+                    self._idle.put(driver)
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        with self._lock:
+            drivers = list(self._all)
+        for driver in drivers:
+            self._discard(driver)
+
+    def screenshot_html(self, html, timeout=MAP_RENDER_TIMEOUT):
+        """打开一段 HTML，等待地图瓦片加载完成后返回 PNG 截图字节"""
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.html', encoding='utf-8', delete=False) as f:
+            f.write(html)
+            temp_file = f.name
+        try:
+            with self.acquire() as driver:
+                driver.get(f"file://{temp_file}")
+                try:
+                    WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+                        lambda d: d.execute_script(TILES_LOADED_JS))
+                except TimeoutException:
+                    print(f"地图瓦片 {timeout}s 内未全部加载，按当前画面截图")
+                return driver.get_screenshot_as_png()
+        finally:
+            os.unlink(temp_file)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """进程内共享的浏览器池（首次使用时创建，进程退出时关闭所有浏览器）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def warm_async(count=None):
+    """后台线程预热共享浏览器池，应用启动时调用，不阻塞启动"""
+    threading.Thread(target=get_pool().warm, args=(count,), daemon=True, name="browser-warm").start()
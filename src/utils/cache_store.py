@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+
+# 缓存文件目录（与 temp/travel_plans 同级）
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "temp", "cache"))
+
+# 地理编码/POI 缓存配置：地名到坐标的映射基本不变，TTL 取 30 天
+GEO_CACHE_PATH = os.getenv("GEO_CACHE_PATH", os.path.join(CACHE_DIR, "geo_cache.sqlite3"))
+GEO_CACHE_TTL = int(os.getenv("GEO_CACHE_TTL", 30 * 24 * 3600))
+GEO_CACHE_MEMORY_SIZE = int(os.getenv("GEO_CACHE_MEMORY_SIZE", 4096))
+
+
+class TTLCache:
+    """
+    线程安全的内存 LRU 缓存，每个条目带过期时间
+    超出 max_items 时淘汰最久未使用的条目
+    """
+
+    def __init__(self, max_items=1024, ttl=3600):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """返回 (是否命中, 值)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class PersistentCache:
+    """
+    两级缓存：内存 LRU 在前，SQLite 在后
+    值以 JSON 形式落盘，进程重启后仍可命中；过期条目在读取或 purge_expired 时清除
+    指定 max_rows 时磁盘条目数超限后优先淘汰最早过期的条目
+    """
+
+    # 每写入多少次检查一次磁盘条目数
+    TRIM_EVERY = 64
+
+    def __init__(self, db_path, ttl=3600, memory_size=1024, max_rows=None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.memory = TTLCache(max_items=memory_size, ttl=ttl)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+        return self._conn
+
+    def get(self, namespace, key):
+        """返回 (是否命中, 值)，先查内存再查磁盘，磁盘命中会回填内存"""
+        hit, value = self.memory.get((namespace, key))
+        if hit:
+            return True, value
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                    (namespace, key),
+                ).fetchone()
+                if row is not None and row[1] <= time.time():
+                    self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+                    self._conn.commit()
+                    row = None
+        except sqlite3.Error as e:
+            print(f"缓存读取失败: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return False, None
+        value = json.loads(row[0])
+        self.memory.set((namespace, key), value, max(row[1] - time.time(), 0))
+        self.disk_hits += 1
+        return True, value
+
+    def set(self, namespace, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set((namespace, key), value, ttl)
+        try:
+            with self._lock:
+                self._connect().execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+                )
+                self._writes += 1
+                if self.max_rows and self._writes % self.TRIM_EVERY == 0:
+                    self._trim()
+                self._conn.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"缓存写入失败: {e}")
+
+    def _trim(self):
+        """磁盘条目超过 max_rows 时删除最早过期的多余条目（调用方持有锁）"""
+        count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_rows:
+            self._conn.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY expires_at LIMIT ?)",
+                (count - self.max_rows,),
+            )
+
+    def purge_expired(self):
+        """删除磁盘上所有已过期的条目，返回删除数量"""
+        with self._lock:
+            cur = self._connect().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cur.rowcount
+
+    def clear(self, namespace=None):
+        self.memory.clear()
+        with self._lock:
+            if namespace is None:
+                self._connect().execute("DELETE FROM cache")
+            else:
+                self._connect().execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+            self._conn.commit()
+
+    def stats(self):
+        memory_hits = self.memory.hits
+        total = memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_size": len(self.memory),
+            "memory_hits": memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (memory_hits + self.disk_hits) / total if total else 0.0,
+        }
+
+
+def make_key(*args):
+    """将参数序列化为稳定的缓存键（字符串去除首尾空白，dict 按键排序）"""
+    normalized = [a.strip() if isinstance(a, str) else a for a in args]
+    return json.dumps(normalized, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def cached(cache, namespace, ttl=None, is_valid=None, restore=None):
+    """
+    函数结果缓存装饰器
+    :param cache: PersistentCache 实例
+    :param namespace: 命名空间，区分不同函数的结果
+    :param is_valid: 判断结果是否可缓存，默认仅缓存非空结果（失败结果不缓存，下次重试）
+    :param restore: 从 JSON 取回后的还原函数（如 tuple），JSON 会把元组存成列表
+    """
+    if is_valid is None:
+        is_valid = bool
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = make_key(*args)
+            hit, value = cache.get(namespace, key)
+            if hit:
+                return restore(value) if restore else value
+            value = func(*args)
+            if is_valid(value):
+                cache.set(namespace, key, value, ttl)
+            return value
+
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
+
+
+# 地理编码/POI 共享缓存（amap.py、travel.py、app.py 共用）
+GEO_CACHE = PersistentCache(GEO_CACHE_PATH, ttl=GEO_CACHE_TTL, memory_size=GEO_CACHE_MEMORY_SIZE)
+
+
+def geo_cached(namespace, is_valid=None, restore=None):
+    """地理编码/POI 查询专用的缓存装饰器"""
+    return cached(GEO_CACHE, namespace, ttl=GEO_CACHE_TTL, is_valid=is_valid, restore=restore)
@@ -0,0 +1,129 @@
+import os
+import time
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+# 嵌入阶段配置（可通过环境变量覆盖）
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+# torch 算子内线程数，0 表示保持 torch 默认值
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", 0))
+# 是否归一化向量（bge 系列推荐归一化，归一化后 FAISS 的 L2 排序与余弦相似度一致）；
+# 默认关闭以保持已有索引的向量不变，开启后索引配置变化会触发全量重建
+EMBED_NORMALIZE = os.getenv("EMBED_NORMALIZE", "0") == "1"
+# 推理后端：torch 或 onnx（onnx 需安装 optimum[onnxruntime]）
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+# ONNX 模型文件（相对模型目录），默认使用不依赖特定指令集的 fp32 版本；
+# int8 量化版本（如 onnx/model_qint8_avx512_vnni.onnx）需 CPU 支持对应指令集，确认后再通过该变量指定
+EMBED_ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "onnx/model.onnx")
+# 每隔多少批打印一次进度
+EMBED_LOG_EVERY = int(os.getenv("EMBED_LOG_EVERY", 20))
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    按固定批大小分批嵌入并打印吞吐量（chunks/s）
+    查询向量直接委托给内部嵌入模型
+    """
+
+    def __init__(self, inner, batch_size=EMBED_BATCH_SIZE, log_every=EMBED_LOG_EVERY, settings=None):
+        self.inner = inner
+        self.batch_size = max(1, batch_size)
+        self.log_every = log_every
+        self.settings = settings or {}
+        self.last_stats = {}
+
+    def embed_documents(self, texts):
+        total = len(texts)
+        vectors = []
+        start = time.perf_counter()
+        for batch_no, i in enumerate(range(0, total, self.batch_size), 1):
+            vectors.extend(self.inner.embed_documents(texts[i:i + self.batch_size]))
+            if self.log_every and batch_no % self.log_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"[INFO] 嵌入进度: {len(vectors)}/{total} ({len(vectors) / elapsed:.1f} chunks/s)")
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            "chunks": total,
+            "seconds": elapsed,
+            "chunks_per_second": total / elapsed if elapsed > 0 else 0.0,
+        }
+        if total:
+            print(f"[INFO] 嵌入完成: {total} 个文本块, 耗时 {elapsed:.2f}s, {self.last_stats['chunks_per_second']:.1f} chunks/s")
+        return vectors
+
+    def embed_query(self, text):
+        return self.inner.embed_query(text)
+
+
+def set_torch_threads(threads):
+    """设置 torch 算子内线程数（未安装 torch 时忽略）"""
+    if not threads:
+        return
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _resolve_backend(model_path, backend, onnx_file):
+    """检查 ONNX 模型文件是否存在，不存在时退回 torch"""
+    if backend != "onnx":
+        return "torch", None
+    if not (Path(model_path) / onnx_file).exists():
+        print(f"[WARN] 未找到 ONNX 模型文件 {onnx_file}，改用 torch 推理")
+        return "torch", None
+    return "onnx", onnx_file
+
+
+def embedder_settings(model_path, normalize, backend, onnx_file=None):
+    """影响向量结果的嵌入配置，用于索引清单比对"""
+    return {
+        "embedding_model": Path(model_path).name,
+        "normalize": normalize,
+        "backend": backend if backend == "torch" else f"onnx:{onnx_file}",
+    }
+
+
+def build_embedder(model_path, batch_size=None, threads=None, normalize=None, backend=None, onnx_file=None):
+    """
+    构建 CPU 嵌入模型
+    :param batch_size: 每批文本数，默认 EMBED_BATCH_SIZE
+    :param threads: torch 线程数，默认 EMBED_THREADS
+    :param normalize: 是否归一化向量，默认 EMBED_NORMALIZE
+    :param backend: torch 或 onnx，默认 EMBED_BACKEND
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    normalize = EMBED_NORMALIZE if normalize is None else normalize
+    set_torch_threads(EMBED_THREADS if threads is None else threads)
+    backend, onnx_file = _resolve_backend(model_path, backend or EMBED_BACKEND, onnx_file or EMBED_ONNX_FILE)
+    settings = embedder_settings(model_path, normalize, backend, onnx_file)
+
+    encode_kwargs = {"batch_size": batch_size, "normalize_embeddings": normalize}
+    model_kwargs = {"device": "cpu"}
+    if backend == "onnx":
+        model_kwargs.update({"backend": "onnx", "model_kwargs": {"file_name": onnx_file}})
+    try:
+        inner = HuggingFaceEmbeddings(model_name=str(model_path), model_kwargs=model_kwargs, encode_kwargs=encode_kwargs)
+    except Exception as e:
+        if backend != "onnx":
+            raise
+        print(f"[WARN] ONNX 后端加载失败，改用 torch 推理: {e}")
+        settings["backend"] = "torch"
+        inner = HuggingFaceEmbeddings(model_name=str(model_path), model_kwargs={"device": "cpu"}, encode_kwargs=encode_kwargs)
+    return BatchedEmbeddings(inner, batch_size=batch_size, settings=settings)
+
+
+def export_quantized_onnx(model_path, config="avx512_vnni"):
+    """
+    将模型导出为 int8 动态量化的 ONNX 文件（保存在模型目录的 onnx/ 下）
+    需安装 sentence-transformers>=3.2 和 optimum[onnxruntime]；量化文件只能在支持 config 对应指令集的 CPU 上运行，
+    使用时通过 EMBED_ONNX_FILE 指定
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+    model = SentenceTransformer(str(model_path), backend="onnx", device="cpu")
+    export_dynamic_quantized_onnx_model(model, config, str(model_path))
+    print(f"已导出量化模型: {Path(model_path) / 'onnx' / f'model_qint8_{config}.onnx'}"
+          f"（设置 EMBED_ONNX_FILE=onnx/model_qint8_{config}.onnx 后生效）")
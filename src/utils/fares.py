@@ -0,0 +1,144 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import timetable
+
+# 席别按 TRAIN_PRICE_FIELDS 顺序排列（商务座 → 二等座），作为有序分类便于排序和筛选
+SEAT_CLASSES = [label for _, label in timetable.TRAIN_PRICE_FIELDS]
+SEAT_DTYPE = pd.CategoricalDtype(SEAT_CLASSES, ordered=True)
+
+# 票价表（每行一个“车次 × 席别”）的列与类型
+FARE_DTYPES = {
+    "trainno": "string",
+    "train_type": "string",
+    "departure": "string",       # HH:MM
+    "arrival": "string",         # HH:MM
+    "depart_min": "float64",     # 出发时间（当天分钟数）
+    "duration_min": "float64",   # 历时（分钟，跨天到达已修正）
+    "next_day": "bool",          # 是否次日到达
+    "seat": SEAT_DTYPE,
+    "price": "float64",
+}
+FARE_COLUMNS = list(FARE_DTYPES)
+
+# 界面展示用的中文列名
+DISPLAY_COLUMNS = {
+    "trainno": "车次",
+    "train_type": "类型",
+    "departure": "出发",
+    "arrival": "到达",
+    "duration_min": "历时(分钟)",
+    "seat": "席别",
+    "price": "票价(元)",
+}
+
+FARE_SORT_KEYS = {
+    "price": ["price", "depart_min"],
+    "departure": ["depart_min", "price"],
+    "duration": ["duration_min", "price"],
+}
+
+
+def empty_fares():
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in FARE_DTYPES.items()})
+
+
+def build_train_fares(trains):
+    """
+    将 query_trains 的结果展开为票价表：每个有票价的“车次 × 席别”一行
+    票价矩阵一次性转换后用 np.nonzero 展开，不逐行拼接字符串
+    """
+    if not trains:
+        return empty_fares()
+    prices = timetable.price_matrix(trains, timetable.TRAIN_PRICE_FIELDS)
+    rows, cols = np.nonzero(~np.isnan(prices))
+    dep_raw = np.asarray(timetable.field_values(trains, "departuretime"), dtype=object)
+    arr_raw = np.asarray(timetable.field_values(trains, "arrivaltime"), dtype=object)
+    dep = timetable.hhmm_to_minutes(dep_raw)
+    arr = timetable.hhmm_to_minutes(arr_raw)
+    next_day = arr < dep
+    duration = arr + np.where(next_day, timetable.MINUTES_PER_DAY, 0) - dep
+    fares = pd.DataFrame({
+        "trainno": np.asarray(timetable.field_values(trains, "trainno"), dtype=object)[rows],
+        "train_type": np.asarray(timetable.field_values(trains, "type"), dtype=object)[rows],
+        "departure": dep_raw[rows],
+        "arrival": arr_raw[rows],
+        "depart_min": dep[rows],
+        "duration_min": duration[rows],
+        "next_day": next_day[rows],
+        "seat": pd.Categorical.from_codes(cols, dtype=SEAT_DTYPE),
+        "price": prices[rows, cols],
+    })
+    return fares.astype(FARE_DTYPES)
+
+
+def filter_fares(fares, seats=None, max_price=None, max_duration=None, depart_from=None, depart_to=None,
+                 sort_by="price"):
+    """
+    按席别、最高票价、最长历时（分钟）、出发时间段（HH:MM）筛选并排序
+    :param sort_by: price / departure / duration
+    """
+    mask = np.ones(len(fares), dtype=bool)
+    if seats:
+        mask &= fares["seat"].isin(seats).to_numpy()
+    if max_price is not None:
+        mask &= (fares["price"] <= float(max_price)).to_numpy()
+    if max_duration is not None:
+        mask &= (fares["duration_min"] <= float(max_duration)).to_numpy()
+    depart = fares["depart_min"].to_numpy()
+    for bound, cmp in ((depart_from, np.greater_equal), (depart_to, np.less_equal)):
+        if bound:
+            minutes = timetable.hhmm_to_minutes([bound])[0]
+            if not np.isnan(minutes):
+                mask &= cmp(depart, minutes)
+    fares = fares[mask]
+    if sort_by:
+        keys = [fares[col].to_numpy() for col in reversed(FARE_SORT_KEYS[sort_by])]
+        fares = fares.iloc[np.lexsort(keys)]
+    return fares
+
+
+def to_display(fares):
+    """转为界面展示的表格（中文列名，次日到达的到达时间加“+1”）"""
+    table = fares[list(DISPLAY_COLUMNS)].rename(columns=DISPLAY_COLUMNS)
+    table["到达"] = fares["arrival"].where(~fares["next_day"], fares["arrival"] + "+1").to_numpy()
+    table["席别"] = table["席别"].astype(str)
+    return table.reset_index(drop=True)
+
+
+def cheapest_by_train(fares, limit=3):
+    """每个车次取最低票价的席别，再按票价取前 limit 个（用于攻略）"""
+    if fares.empty:
+        return fares
+    best = fares.sort_values(["price", "depart_min"], kind="stable").drop_duplicates("trainno")
+    return best.head(limit)
+
+
+def save_leg_fares(path, leg_fares):
+    """
+    保存各段火车行程的推荐票价，供攻略生成使用
+    :param leg_fares: {行程表行号: ((日期, 出发地, 目的地), 票价表 DataFrame)}，
+                      行程段一并保存，读取方据此确认票价仍属于同一段行程
+    """
+    data = {
+        str(index): {"leg": list(leg), "fares": fares.astype({"seat": str}).to_dict(orient="records")}
+        for index, (leg, fares) in leg_fares.items()
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def load_leg_fares(path):
+    """读取 save_leg_fares 保存的票价，返回同样结构的 dict；文件不存在或损坏时返回空 dict"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {
+            int(index): (tuple(entry["leg"]),
+                         pd.DataFrame(entry["fares"], columns=FARE_COLUMNS).astype(FARE_DTYPES))
+            for index, entry in data.items()
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
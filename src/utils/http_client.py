@@ -0,0 +1,146 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 连接池与重试配置（可通过环境变量覆盖）
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 16))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.3))
+BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 5))
+
+# 幂等方法才默认重试；POST（如大模型对话）需调用方显式传 retries
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# 每个主机保留的最近延迟样本数（用于计算 p95）
+LATENCY_WINDOW = 512
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _host_of(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_session(url):
+    """获取目标主机对应的 keep-alive 会话（每个主机一个连接池，线程间共享）"""
+    host = _host_of(url)
+    session = _sessions.get(host)
+    if session is not None:
+        return session
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+        return session
+
+
+def _backoff(attempt):
+    """指数退避 + 全抖动"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _record(host, elapsed, ok):
+    with _metrics_lock:
+        m = _metrics.get(host)
+        if m is None:
+            m = _metrics[host] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "total_time": 0.0,
+                "samples": deque(maxlen=LATENCY_WINDOW),
+            }
+        m["requests"] += 1
+        if not ok:
+            m["errors"] += 1
+        m["total_time"] += elapsed
+        m["samples"].append(elapsed)
+
+
+def _record_retry(host):
+    with _metrics_lock:
+        if host in _metrics:
+            _metrics[host]["retries"] += 1
+
+
+def request(method, url, retries=None, **kwargs):
+    """
+    通过共享连接池发送请求，接口与 requests.request 一致
+    :param retries: 失败重试次数，默认幂等方法为 MAX_RETRIES，其余为 0
+    流式请求（stream=True）的延迟统计到收到响应头为止
+    """
+    method = method.upper()
+    if retries is None:
+        retries = MAX_RETRIES if method in IDEMPOTENT_METHODS else 0
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    host = _host_of(url)
+    session = get_session(url)
+    attempt = 0
+    while True:
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            _record(host, time.perf_counter() - start, False)
+            if attempt >= retries:
+                raise
+        else:
+            ok = response.status_code < 400
+            _record(host, time.perf_counter() - start, ok)
+            if response.status_code not in RETRY_STATUS or attempt >= retries:
+                return response
+            response.close()
+        _record_retry(host)
+        time.sleep(_backoff(attempt))
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def host_metrics():
+    """返回每个主机的请求数、错误数、重试数、平均延迟和 p95 延迟（秒）"""
+    result = {}
+    with _metrics_lock:
+        for host, m in _metrics.items():
+            samples = sorted(m["samples"])
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+            result[host] = {
+                "requests": m["requests"],
+                "errors": m["errors"],
+                "retries": m["retries"],
+                "avg_latency": m["total_time"] / m["requests"] if m["requests"] else 0.0,
+                "p95_latency": p95,
+            }
+    return result
+
+
+def close_all():
+    """关闭所有连接池（进程退出或测试时使用）"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
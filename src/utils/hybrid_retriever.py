@@ -0,0 +1,165 @@
+import os
+import re
+import math
+import pickle
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# 检索配置（可通过环境变量覆盖）
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 5))
+# 每路（关键词/向量）召回的候选数
+RAG_FETCH_K = int(os.getenv("RAG_FETCH_K", 20))
+# 融合分数低于该阈值的结果丢弃（分数范围 0~1）
+RAG_SCORE_THRESHOLD = float(os.getenv("RAG_SCORE_THRESHOLD", 0.2))
+# 向量分数权重，关键词分数权重为 1 - RAG_VECTOR_WEIGHT
+RAG_VECTOR_WEIGHT = float(os.getenv("RAG_VECTOR_WEIGHT", 0.5))
+
+try:
+    import jieba
+    jieba.setLogLevel(60)
+except ImportError:
+    jieba = None
+
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]+")
+_WORD_RE = re.compile(r"[\u4e00-\u9fff]+|[A-Za-z0-9]+")
+
+
+def _cjk_ngrams(text):
+    """中文按单字+相邻双字切分（未安装 jieba 时使用）"""
+    tokens = list(text)
+    tokens.extend(text[i:i + 2] for i in range(len(text) - 1))
+    return tokens
+
+
+def tokenize(text):
+    """中英文混合分词：中文优先用 jieba 搜索模式，否则用单字+双字；英文数字按词并转小写"""
+    tokens = []
+    for part in _WORD_RE.findall(text):
+        if _CJK_RE.fullmatch(part):
+            if jieba is not None:
+                tokens.extend(t for t in jieba.cut_for_search(part) if t.strip())
+            else:
+                tokens.extend(_cjk_ngrams(part))
+        else:
+            tokens.append(part.lower())
+    return tokens
+
+
+class BM25Index:
+    """基于倒排表的 BM25 关键词索引，文档编号与 FAISS 向量位置一一对应"""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(doc_idx, tf), ...]
+        self.doc_lens = []
+        for idx, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((idx, tf))
+        self.postings = dict(self.postings)
+        n = len(self.doc_lens)
+        self.avg_len = (sum(self.doc_lens) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    def scores(self, query):
+        """返回 {doc_idx: BM25分数}，只遍历包含查询词的文档"""
+        result = defaultdict(float)
+        avg_len = self.avg_len or 1.0
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf[term]
+            for idx, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[idx] / avg_len)
+                result[idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return result
+
+    def save(self, path):
+        # 只保存属性字典，避免依赖模块导入路径
+        with open(path, "wb") as f:
+            pickle.dump(self.__dict__, f)
+
+    @staticmethod
+    def load(path):
+        index = BM25Index.__new__(BM25Index)
+        with open(path, "rb") as f:
+            index.__dict__.update(pickle.load(f))
+        return index
+
+
+class HybridRetriever:
+    """
+    关键词（BM25）+ 向量（FAISS）混合检索
+    两路各召回 fetch_k 个候选，合并后统一计算两种分数并加权融合，一次检索完成排序和阈值过滤
+    """
+
+    def __init__(self, vectordb, bm25=None, k=RAG_TOP_K, fetch_k=RAG_FETCH_K,
+                 score_threshold=RAG_SCORE_THRESHOLD, vector_weight=RAG_VECTOR_WEIGHT):
+        self.vectordb = vectordb
+        self.bm25 = bm25 if bm25 is not None else build_bm25(vectordb)
+        self.k = k
+        self.fetch_k = fetch_k
+        self.score_threshold = score_threshold
+        self.vector_weight = vector_weight
+
+    def _doc(self, idx):
+        doc_id = self.vectordb.index_to_docstore_id[idx]
+        return self.vectordb.docstore.search(doc_id)
+
+    def _cosine(self, query_vec, indices):
+        vecs = np.vstack([self.vectordb.index.reconstruct(int(i)) for i in indices])
+        norms = np.linalg.norm(vecs, axis=1) * (np.linalg.norm(query_vec) or 1.0)
+        norms[norms == 0] = 1.0
+        return np.clip(vecs @ query_vec / norms, 0.0, 1.0)
+
+    def search(self, query, k=None, score_threshold=None):
+        """返回 [(Document, 融合分数), ...]，按分数降序"""
+        k = self.k if k is None else k
+        score_threshold = self.score_threshold if score_threshold is None else score_threshold
+        total = self.vectordb.index.ntotal
+        if not query.strip() or total == 0:
+            return []
+
+        # 关键词召回
+        bm25_scores = self.bm25.scores(query)
+        keyword_top = sorted(bm25_scores, key=bm25_scores.get, reverse=True)[:self.fetch_k]
+
+        # 向量召回（查询只嵌入一次）
+        query_vec = np.asarray(self.vectordb.embedding_function.embed_query(query), dtype=np.float32)
+        _, found = self.vectordb.index.search(query_vec.reshape(1, -1), min(self.fetch_k, total))
+        vector_top = [int(i) for i in found[0] if i >= 0]
+
+        candidates = list(dict.fromkeys(vector_top + keyword_top))
+        if not candidates:
+            return []
+        vec_scores = self._cosine(query_vec, candidates)
+        max_bm25 = max((bm25_scores.get(i, 0.0) for i in candidates), default=0.0) or 1.0
+
+        w = self.vector_weight
+        fused = [
+            (idx, w * float(vec_scores[n]) + (1 - w) * bm25_scores.get(idx, 0.0) / max_bm25)
+            for n, idx in enumerate(candidates)
+        ]
+        fused.sort(key=lambda item: item[1], reverse=True)
+        return [(self._doc(idx), score) for idx, score in fused[:k] if score >= score_threshold]
+
+    def invoke(self, query):
+        """与 LangChain 检索器一致的接口：返回 Document 列表"""
+        return [doc for doc, _ in self.search(query)]
+
+
+def build_bm25(vectordb):
+    """按 FAISS 向量位置顺序构建 BM25 索引"""
+    texts = [vectordb.docstore.search(vectordb.index_to_docstore_id[i]).page_content
+             for i in range(vectordb.index.ntotal)]
+    return BM25Index(texts)
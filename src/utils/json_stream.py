@@ -0,0 +1,76 @@
+import re
+import json
+
+# 扫描时只需关注的字符：对象边界、字符串引号和转义符
+_SPECIAL_RE = re.compile(r'[{}"\\]')
+
+
+class JsonObjectStream:
+    """
+    增量 JSON 对象解析器：按增量喂入大模型输出的文本，最外层对象的右括号一到达就解析并返回该对象
+    - 支持嵌套对象、字符串内的括号和转义字符（转义可跨增量边界）
+    - 对象之外的内容（```json 代码块标记、数组括号、逗号、说明文字）直接跳过
+    - 解析状态跨增量保留，每个字符只扫描一次，总工作量与输出长度成线性关系
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.parts = []  # 当前未闭合对象已收到的文本片段
+
+    def feed(self, text):
+        """喂入一段增量文本，返回本次完成的对象列表（解析失败的片段丢弃）"""
+        objects = []
+        start = 0 if self.depth else None
+        i = 0
+        if self.escape and text:
+            # 上一段以转义符结尾，本段首字符属于转义序列
+            self.escape = False
+            i = 1
+        while True:
+            m = _SPECIAL_RE.search(text, i)
+            if m is None:
+                break
+            j = m.start()
+            c = text[j]
+            i = j + 1
+            if self.in_string:
+                if c == "\\":
+                    if i < len(text):
+                        i += 1
+                    else:
+                        self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                continue
+            if self.depth == 0:
+                if c == "{":
+                    self.depth = 1
+                    start = j
+                continue
+            if c == '"':
+                self.in_string = True
+            elif c == "{":
+                self.depth += 1
+            elif c == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.parts.append(text[start:i])
+                    raw = "".join(self.parts)
+                    self.parts = []
+                    start = None
+                    try:
+                        objects.append(json.loads(raw))
+                    except ValueError:
+                        pass
+        if self.depth and start is not None:
+            self.parts.append(text[start:])
+        return objects
+
+
+def iter_json_objects(deltas):
+    """把文本增量流转换为 JSON 对象流"""
+    parser = JsonObjectStream()
+    for delta in deltas:
+        yield from parser.feed(delta)
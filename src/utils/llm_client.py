@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import codecs
+import threading
+
+import http_client
+
+# 大模型接口配置（SiliconFlow，OpenAI 兼容协议）
+API_URL = "https://api.siliconflow.cn/v1/chat/completions"
+DEFAULT_MODEL = "deepseek-ai/DeepSeek-V3"
+STREAM_TIMEOUT = int(os.getenv("LLM_STREAM_TIMEOUT", 120))
+CHAT_TIMEOUT = int(os.getenv("LLM_CHAT_TIMEOUT", 300))
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def iter_sse_events(chunks):
+    """
+    增量解析 SSE 字节流，逐个 yield 事件的 data 字段（多行 data 以换行拼接）
+    :param chunks: 字节块的可迭代对象（如 response.iter_content()），块边界可以落在任意位置
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    data_lines = []
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        while True:
+            pos = pending.find("\n")
+            if pos < 0:
+                break
+            line = pending[:pos].rstrip("\r")
+            pending = pending[pos + 1:]
+            if not line:
+                # 空行表示一个事件结束
+                if data_lines:
+                    yield "\n".join(data_lines)
+                    data_lines = []
+                continue
+            if line.startswith(":"):
+                continue  # 注释/心跳
+            field, _, value = line.partition(":")
+            if field == "data":
+                data_lines.append(value[1:] if value.startswith(" ") else value)
+    pending += decoder.decode(b"", final=True)
+    if pending.startswith("data:"):
+        data_lines.append(pending[5:].lstrip(" ").rstrip("\r"))
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+def _model_metrics(model):
+    return _metrics.setdefault(model, {
+        "stream_requests": 0, "ttft_count": 0, "ttft_total": 0.0, "tokens": 0, "generation_time": 0.0,
+        "chat_requests": 0, "chat_time": 0.0,
+    })
+
+
+def _record(model, ttft, elapsed, tokens):
+    """流式请求：首 token 延迟与生成速度只统计收到过输出的请求"""
+    with _metrics_lock:
+        m = _model_metrics(model)
+        m["stream_requests"] += 1
+        if ttft is not None:
+            m["ttft_count"] += 1
+            m["ttft_total"] += ttft
+            m["tokens"] += tokens
+            m["generation_time"] += max(elapsed - ttft, 0.0)
+
+
+def _record_chat(model, elapsed):
+    """非流式请求只有总耗时，单独统计，不计入首 token 延迟和生成速度"""
+    with _metrics_lock:
+        m = _model_metrics(model)
+        m["chat_requests"] += 1
+        m["chat_time"] += elapsed
+
+
+def llm_metrics():
+    """
+    返回每个模型的请求数，流式请求的平均首 token 延迟（秒）和平均生成速度（tokens/s），
+    以及非流式请求的平均耗时（秒）
+    """
+    with _metrics_lock:
+        return {
+            model: {
+                "requests": m["stream_requests"] + m["chat_requests"],
+                "stream_requests": m["stream_requests"],
+                "avg_ttft": m["ttft_total"] / m["ttft_count"] if m["ttft_count"] else 0.0,
+                "tokens_per_s": m["tokens"] / m["generation_time"] if m["generation_time"] else 0.0,
+                "chat_requests": m["chat_requests"],
+                "avg_chat_latency": m["chat_time"] / m["chat_requests"] if m["chat_requests"] else 0.0,
+            }
+            for model, m in _metrics.items()
+        }
+
+
+def _headers(api_key, stream):
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    if stream:
+        headers["Accept"] = "text/event-stream"
+    return headers
+
+
+def chat_stream(messages, model=DEFAULT_MODEL, api_key=None, api_url=API_URL, cancel_event=None,
+                stats=None, timeout=STREAM_TIMEOUT, **params):
+    """
+    流式对话：逐段 yield 模型输出的文本增量
+    :param cancel_event: 可选 threading.Event，置位后立即停止读取并关闭连接
+    :param stats: 可选 dict，结束时写入 ttft（秒）、tokens、tokens_per_s
+    调用方提前关闭生成器（如 Gradio 客户端断开）时同样会关闭上游连接，不再继续计费
+    """
+    if api_key is None:
+        api_key = os.getenv("SILICON_API_KEY")
+    payload = dict(params, model=model, messages=messages, stream=True)
+    start = time.perf_counter()
+    ttft = None
+    tokens = 0
+    usage_tokens = None
+    response = http_client.post(api_url, headers=_headers(api_key, True), json=payload, stream=True, timeout=timeout)
+    try:
+        if response.status_code != 200:
+            raise RuntimeError(f"请求失败：{response.status_code} {response.text}")
+        for data in iter_sse_events(response.iter_content(chunk_size=None)):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            if chunk.get("usage"):
+                usage_tokens = chunk["usage"].get("completion_tokens", usage_tokens)
+            choices = chunk.get("choices") or [{}]
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                tokens += 1
+                yield content
+    finally:
+        response.close()
+        elapsed = time.perf_counter() - start
+        # 服务端返回 usage 时以其为准，否则按增量块数估算 token 数
+        tokens = usage_tokens or tokens
+        _record(model, ttft, elapsed, tokens)
+        if stats is not None:
+            generation_time = elapsed - (ttft or 0.0)
+            stats.update({
+                "ttft": ttft,
+                "tokens": tokens,
+                "tokens_per_s": tokens / generation_time if generation_time > 0 else 0.0,
+            })
+
+
+def chat(messages, model=DEFAULT_MODEL, api_key=None, api_url=API_URL, timeout=CHAT_TIMEOUT, **params):
+    """非流式对话，返回完整回复文本；请求失败时抛出异常"""
+    if api_key is None:
+        api_key = os.getenv("SILICON_API_KEY")
+    payload = dict(params, model=model, messages=messages)
+    start = time.perf_counter()
+    response = http_client.post(api_url, headers=_headers(api_key, False), json=payload, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    elapsed = time.perf_counter() - start
+    _record_chat(model, elapsed)
+    return data["choices"][0]["message"]["content"]
@@ -25,7 +25,7 @@ def md_to_pdf(md_path, pdf_path, css_path=None):
     if wkhtmltopdf_path is None:
         print("未找到wkhtmltopdf可执行文件，请先安装wkhtmltopdf并确保其在上述常见路径或添加到环境变量PATH中。")
         print("下载地址：https://wkhtmltopdf.org/downloads.html")
-        sys.exit(1)
+        raise FileNotFoundError("未找到wkhtmltopdf可执行文件")
 
     config = Configuration(wkhtmltopdf=wkhtmltopdf_path)
 
@@ -84,19 +84,26 @@ def md_to_pdf(md_path, pdf_path, css_path=None):
 
     pdfkit.from_string(html, pdf_path, configuration=config)
 
-if __name__ == "__main__":
-    # 输入路径
+def main(md_path=None, pdf_path=None):
+    """
+    将攻略md转换为PDF
+    :param md_path: 输入md路径，默认temp/travel_plans/tourGuide.md
+    :param pdf_path: 输出pdf路径，默认travel_guides/tourGuide.pdf
+    :return: 生成的pdf路径
+    """
     base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-    md_path = os.path.join(base_dir, "temp", "travel_plans", "tourGuide.md")
+    # 输入路径
+    if md_path is None:
+        md_path = os.path.join(base_dir, "temp", "travel_plans", "tourGuide.md")
     # 输出路径
-    guides_dir = os.path.join(base_dir, "travel_guides")
-    if not os.path.exists(guides_dir):
-        os.makedirs(guides_dir, exist_ok=True)
-    pdf_path = os.path.join(guides_dir, "tourGuide.pdf")
+    if pdf_path is None:
+        pdf_path = os.path.join(base_dir, "travel_guides", "tourGuide.pdf")
+    md_path, pdf_path = str(md_path), str(pdf_path)
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
     css_path = os.path.join(os.path.dirname(__file__), "markdown.css")  # 可选：自定义CSS文件
     if not os.path.exists(md_path):
         print("输入的md文件不存在")
-        sys.exit(1)
+        raise FileNotFoundError(md_path)
     # 检查常用中文字体
     import platform
     if platform.system() == "Windows":
@@ -115,3 +122,11 @@ if __name__ == "__main__":
         print("如果 emoji 仍为黑白，请安装支持彩色 emoji 的字体，如 Windows 的 Segoe UI Emoji、Linux 的 Noto Color Emoji。")
     md_to_pdf(md_path, pdf_path, css_path)
     print(f"已生成PDF: {pdf_path}")
+    return pdf_path
+
+if __name__ == "__main__":
+    # 可选参数：输入md路径、输出pdf路径
+    try:
+        main(*sys.argv[1:3])
+    except FileNotFoundError:
+        sys.exit(1)
@@ -0,0 +1,211 @@
+import os
+import re
+import csv
+import threading
+from collections import Counter, defaultdict
+
+from airport_index import AhoCorasick, AirportIndex, load_airport_rows
+
+REFERENCE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data", "reference"))
+AIRPORT_CSV_PATH = os.getenv("AIRPORT_CSV_PATH", os.path.join(REFERENCE_DIR, "airportcode.csv"))
+STATION_CSV_PATH = os.getenv("STATION_CSV_PATH", os.path.join(REFERENCE_DIR, "railway_stations.csv"))
+# 模糊匹配（n-gram 相似度）低于该分数的候选丢弃（分数范围 0~1）
+PLACE_MATCH_THRESHOLD = float(os.getenv("PLACE_MATCH_THRESHOLD", 0.5))
+# 查询结果缓存条数上限，超出后清空重建
+PLACE_MEMO_SIZE = int(os.getenv("PLACE_MEMO_SIZE", 4096))
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+# 同分时的类型优先级：城市 > 车站 > 机场
+KIND_ORDER = {"city": 0, "station": 1, "airport": 2}
+
+_CJK_CHAR_RE = re.compile(r"[\u4e00-\u9fa5]")
+_ASCII_RE = re.compile(r"[a-z0-9]+")
+_STRIP_RE = re.compile(r"[\s\-_'’·.,，()（）]+")
+_SUFFIX_RE = re.compile(r"(?<=[\u4e00-\u9fa5]{2})(火车站|高铁站|站|市)$")
+
+
+def load_station_rows(filepath):
+    """读取车站表，返回 [{"station", "city"}, ...]；文件不存在时返回空列表"""
+    rows = []
+    if not os.path.exists(filepath):
+        return rows
+    with open(filepath, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            station = row.get("车站名称", "").strip()
+            if station:
+                rows.append({"station": station, "city": row.get("城市名称", "").strip()})
+    return rows
+
+
+def normalize(text):
+    """统一大小写、去掉空格和标点，中文去掉“市/站/火车站”后缀"""
+    text = _STRIP_RE.sub("", (text or "").strip().lower())
+    return _SUFFIX_RE.sub("", text)
+
+
+def to_pinyin(text):
+    """中文转无声调拼音（如“重庆”→“chongqing”），未安装 pypinyin 时返回空字符串"""
+    if lazy_pinyin is None or not text:
+        return ""
+    return "".join(lazy_pinyin(text)).lower()
+
+
+def has_cjk(text):
+    return bool(_CJK_CHAR_RE.search(text or ""))
+
+
+def _grams(key):
+    """拼音/英文按首尾补位的三字母切分，中文按单字+相邻双字切分"""
+    if _ASCII_RE.fullmatch(key):
+        padded = f"^{key}$"
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    grams = set(key)
+    grams.update(key[i:i + 2] for i in range(len(key) - 1))
+    return grams
+
+
+class PlaceResolver:
+    """
+    城市/机场/车站名称解析：中文名、简称、英文名、拼音（含“城市+机场/车站”组合，如 shanghaihongqiao）统一建索引
+    - 精确匹配：规范化后的名称哈希表，得分 1
+    - 包含匹配：中文长文本（如“上海虹桥国际机场”“成都宽窄巷子”）用 Aho-Corasick 找出包含的名称
+    - 模糊匹配：n-gram 倒排表计算 Dice 相似度，容忍拼写错误
+    """
+
+    def __init__(self, airport_rows, station_rows=()):
+        self.airports = AirportIndex(airport_rows)
+        self.places = []      # [{"kind", "name", "city", "code"}, ...]
+        self.keys = []        # 规范化后的索引键
+        self.key_places = []  # 每个键对应的地点编号列表
+        self._key_ids = {}
+        self._place_ids = {}
+        self.postings = defaultdict(list)  # gram -> [键编号, ...]
+        self.key_gram_counts = []
+
+        for row in airport_rows:
+            if not row.get("code"):
+                continue
+            city = row.get("city", "")
+            if city:
+                pid = self._add_place("city", city, city, self.airports.resolve(city))
+                self._add_keys(pid, city, to_pinyin(city))
+            if row.get("airport") or row.get("short"):
+                name = row.get("airport") or row.get("short")
+                pid = self._add_place("airport", name, city, row["code"])
+                short_pinyin = to_pinyin(row.get("short", ""))
+                self._add_keys(pid, row.get("airport", ""), row.get("short", ""), row.get("english", ""),
+                               to_pinyin(row.get("airport", "")), short_pinyin,
+                               to_pinyin(city) + short_pinyin if short_pinyin and city else "")
+        for row in station_rows:
+            station, city = row["station"], row.get("city", "")
+            pid = self._add_place("station", station, city or station, self.airports.resolve(city) if city else "")
+            self._add_keys(pid, station, to_pinyin(station))
+
+        for kid, key in enumerate(self.keys):
+            grams = _grams(key)
+            self.key_gram_counts.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(kid)
+        cjk_keys = [(kid, key) for kid, key in enumerate(self.keys) if not _ASCII_RE.fullmatch(key)]
+        self._cjk_key_ids = [kid for kid, _ in cjk_keys]
+        self.matcher = AhoCorasick([key for _, key in cjk_keys])
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    def _add_place(self, kind, name, city, code):
+        ident = (kind, name)
+        if ident in self._place_ids:
+            return self._place_ids[ident]
+        pid = self._place_ids[ident] = len(self.places)
+        self.places.append({"kind": kind, "name": name, "city": city, "code": code})
+        return pid
+
+    def _add_keys(self, pid, *names):
+        for name in names:
+            key = normalize(name)
+            if not key:
+                continue
+            kid = self._key_ids.get(key)
+            if kid is None:
+                kid = self._key_ids[key] = len(self.keys)
+                self.keys.append(key)
+                self.key_places.append([])
+            if pid not in self.key_places[kid]:
+                self.key_places[kid].append(pid)
+
+    def _score_keys(self, query):
+        """{键编号: 得分}：精确 1（命中时不再做包含/模糊匹配），包含 0.5~1，模糊为 Dice 相似度"""
+        kid = self._key_ids.get(query)
+        if kid is not None:
+            return {kid: 1.0}
+        scores = {}
+        if not _ASCII_RE.fullmatch(query):
+            for idx in self.matcher.find(query):
+                kid = self._cjk_key_ids[idx]
+                scores.setdefault(kid, 0.5 + 0.5 * len(self.keys[kid]) / len(query))
+        grams = _grams(query)
+        overlap = Counter()
+        for gram in grams:
+            overlap.update(self.postings.get(gram, ()))
+        for kid, common in overlap.items():
+            dice = 2.0 * common / (len(grams) + self.key_gram_counts[kid])
+            if dice >= PLACE_MATCH_THRESHOLD and dice > scores.get(kid, 0):
+                scores[kid] = dice
+        return scores
+
+    def resolve(self, query, kinds=None, limit=5):
+        """
+        返回按得分排序的候选 [{"kind", "name", "city", "code", "score"}, ...]
+        :param kinds: 只保留这些类型（"city"/"airport"/"station"），None 表示不限
+        """
+        memo_key = (query, tuple(kinds) if kinds else None, limit)
+        found = self._memo.get(memo_key)
+        if found is not None:
+            return found
+        norm = normalize(query)
+        best = {}
+        if norm:
+            for kid, score in self._score_keys(norm).items():
+                for pid in self.key_places[kid]:
+                    if (not kinds or self.places[pid]["kind"] in kinds) and score > best.get(pid, 0):
+                        best[pid] = score
+        ranked = sorted(best, key=lambda pid: (-best[pid], KIND_ORDER[self.places[pid]["kind"]], pid))[:limit]
+        found = [dict(self.places[pid], score=round(best[pid], 3)) for pid in ranked]
+        with self._memo_lock:
+            if len(self._memo) >= PLACE_MEMO_SIZE:
+                self._memo.clear()
+            self._memo[memo_key] = found
+        return found
+
+    def exact(self, query, kinds=None):
+        """只做精确匹配（规范化后的名称完全相同），不做包含/模糊匹配，找不到返回 None"""
+        kid = self._key_ids.get(normalize(query))
+        if kid is None:
+            return None
+        pids = [pid for pid in self.key_places[kid] if not kinds or self.places[pid]["kind"] in kinds]
+        if not pids:
+            return None
+        pid = min(pids, key=lambda pid: (KIND_ORDER[self.places[pid]["kind"]], pid))
+        return dict(self.places[pid], score=1.0)
+
+    def best(self, query, kinds=None):
+        """最佳候选，找不到返回 None"""
+        found = self.resolve(query, kinds=kinds, limit=1)
+        return found[0] if found else None
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    """进程内共享的解析器（首次使用时加载机场表与车站表）"""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = PlaceResolver(load_airport_rows(AIRPORT_CSV_PATH), load_station_rows(STATION_CSV_PATH))
+        return _resolver
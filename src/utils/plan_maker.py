@@ -1,7 +1,9 @@
 import os
-import json
+import sys
 from dotenv import load_dotenv
-import requests
+import llm_client
+import trip_extractor
+import fares
 
 # 加载API.env中的环境变量
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../../API.env'))
@@ -11,75 +13,68 @@ API_URL = "https://api.siliconflow.cn/v1/chat/completions"
 MODEL_NAME = "deepseek-ai/DeepSeek-V3"
 
 def get_chat_response(messages, model_name):
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": model_name,
-        "messages": messages
-    }
     try:
-        response = requests.post(API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        return llm_client.chat(messages, model=model_name, api_key=API_KEY, api_url=API_URL)
     except Exception as e:
         return f"Error: {str(e)}"
 
 def read_plan_table(llm_path):
     """
-    读取route_planning_LLMoutput.json（或jsonl/伪jsonl），返回表格内容字符串和结构化数据
-    支持每行一个json对象的情况（即使扩展名为.json）
+    读取route_planning_LLMoutput.json（JSON数组或每行一个json对象），返回表格内容字符串和行程段
+    :return: (Markdown表格, [TripLeg, ...])
     """
-    table_rows = []
-    table_md = ""
-    # 判断是否为jsonl或每行一个json对象的json
-    with open(llm_path, "r", encoding="utf-8") as f:
-        first_line = f.readline()
-        f.seek(0)
-        try:
-            # 尝试整体解析为json数组
-            data = json.load(f)
-            if isinstance(data, list):
-                table_rows = data
-            else:
-                raise ValueError("旅行规划文件格式错误")
-        except json.JSONDecodeError:
-            # 回退为每行一个json对象
-            f.seek(0)
-            lines = f.readlines()
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                row = json.loads(line)
-                table_rows.append(row)
+    rows, legs = trip_extractor.load_plan(llm_path)
     # 生成Markdown表格
     headers = ["日期", "时间", "地点", "活动", "交通"]
-    table_md += "| " + " | ".join(headers) + " |\n"
+    table_md = "| " + " | ".join(headers) + " |\n"
     table_md += "| " + " | ".join(["---"] * len(headers)) + " |\n"
-    for row in table_rows:
-        table_md += "| " + " | ".join([
-            str(row.get("date", "") or row.get("日期", "")),
-            str(row.get("time", "") or row.get("时间", "")),
-            str(row.get("location", "") or row.get("地点", "")),
-            str(row.get("activity", "") or row.get("活动", "")),
-            str(row.get("transport", "") or row.get("交通", "")),
-        ]) + " |\n"
-    return table_md, table_rows
+    for row in rows:
+        table_md += "| " + " | ".join([row.date, row.time, row.location, row.activity, row.transport]) + " |\n"
+    return table_md, legs
 
-def main():
+def transport_section(legs, leg_fares=None):
+    """
+    攻略“交通”板块：列出行程中的飞机和火车段，没有则保留占位说明
+    :param leg_fares: {行程表行号: ((日期, 出发地, 目的地), 票价表)}，行程查票时保存的推荐车次，
+                      仅在行号对应的行程段与保存时一致时附在该火车段下
+    """
+    icons = {"flight": "✈️", "train": "🚄"}
+    leg_fares = leg_fares or {}
+    lines = []
+    for leg in legs:
+        if leg.mode not in icons or not (leg.start and leg.end):
+            continue
+        lines.append(f"- {icons[leg.mode]} {leg.date} {leg.time} {leg.start} → {leg.end}（{leg.transport}）")
+        saved_leg, options = leg_fares.get(leg.index, (None, None))
+        if leg.mode == "train" and saved_leg == (leg.date, leg.start, leg.end):
+            for fare in options.itertuples():
+                arrival = fare.arrival + ("+1" if fare.next_day else "")
+                lines.append(f"  - {fare.trainno} {fare.departure}→{arrival} {fare.seat} ¥{fare.price:g}")
+    if not lines:
+        return "（本节后续将补充导航、地图等内容）"
+    return "\n".join(lines)
+
+def main(temp_dir=None):
+    """
+    根据行程表生成tourGuide.md
+    :param temp_dir: 会话工作区目录（含route_planning_LLMoutput.json），默认使用temp/travel_plans
+    :return: 生成的md文件路径，失败返回None
+    """
     # 路径准备
-    temp_dir = os.path.join(os.path.dirname(__file__), '../../temp/travel_plans')
+    if temp_dir is None:
+        temp_dir = os.path.join(os.path.dirname(__file__), '../../temp/travel_plans')
+    temp_dir = str(temp_dir)
     llm_path = os.path.join(temp_dir, "route_planning_LLMoutput.json")
     if not os.path.exists(llm_path):
         llm_path = llm_path.replace(".json", ".jsonl")
     if not os.path.exists(llm_path):
         print("未找到旅行规划文件")
-        return
+        return None
 
     # 读取旅行规划表格
-    table_md, table_rows = read_plan_table(llm_path)
+    table_md, legs = read_plan_table(llm_path)
+    # 行程查票时保存的各段火车推荐票价（未查票时为空）
+    leg_fares = fares.load_leg_fares(os.path.join(temp_dir, "ticket_fares.json"))
 
     # 构建大模型提示词
     system_prompt = (
@@ -110,9 +105,11 @@ def main():
     with open(md_path, "w", encoding="utf-8") as f:
         f.write(ai_response)
         f.write("\n\n")
-        f.write("## 交通\n\n（本节后续将补充导航、地图等内容）\n\n")
+        f.write("## 交通\n\n" + transport_section(legs, leg_fares) + "\n\n")
         f.write("## 附录\n\n（本节后续将补充相关附录内容）\n")
     print("AI旅行攻略已保存至 tourGuide.md")
+    return md_path
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # 可选参数：会话工作区目录
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
\ No newline at end of file
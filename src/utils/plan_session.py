@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+from pathlib import Path
+
+# 会话工作区根目录：每个会话一个子目录，互不覆盖
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+PLAN_ROOT = BASE_DIR / "temp" / "travel_plans" / "sessions"
+GUIDES_ROOT = BASE_DIR / "travel_guides"
+
+# 会话工作区超过该时长未访问即视为过期，由垃圾回收清除（秒）
+SESSION_TTL = int(os.getenv("PLAN_SESSION_TTL", 6 * 3600))
+# 会话过期后，其攻略目录（已生成的PDF）再保留的时长（秒），以及所有攻略目录的总大小上限（字节），
+# 超出上限时从最久未更新的过期会话开始删除
+GUIDES_TTL = int(os.getenv("PLAN_GUIDES_TTL", 7 * 24 * 3600))
+GUIDES_MAX_BYTES = int(os.getenv("PLAN_GUIDES_MAX_BYTES", 1024 * 1024 * 1024))
+# 两次垃圾回收的最小间隔（秒）
+GC_INTERVAL = int(os.getenv("PLAN_SESSION_GC_INTERVAL", 600))
+
+GUI_FILENAME = "route_planning_GUIoutput.json"
+LLM_FILENAME = "route_planning_LLMoutput.json"
+MD_FILENAME = "tourGuide.md"
+PDF_FILENAME = "tourGuide.pdf"
+FARES_FILENAME = "ticket_fares.json"
+
+_SESSION_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_gc_lock = threading.Lock()
+_last_gc = 0.0
+
+
+def is_valid_session_id(session_id):
+    """会话ID必须是uuid4的hex形式，防止拼接路径时越权访问其他目录"""
+    return isinstance(session_id, str) and bool(_SESSION_ID_RE.match(session_id))
+
+
+def plan_dir(session_id):
+    return PLAN_ROOT / session_id
+
+
+def guides_dir(session_id):
+    return GUIDES_ROOT / session_id
+
+
+def plan_paths(session_id):
+    """返回会话内各文件路径：gui、llm、md、fares 位于工作区，pdf 位于该会话的攻略目录"""
+    work_dir = plan_dir(session_id)
+    return {
+        "gui": work_dir / GUI_FILENAME,
+        "llm": work_dir / LLM_FILENAME,
+        "md": work_dir / MD_FILENAME,
+        "fares": work_dir / FARES_FILENAME,
+        "pdf": guides_dir(session_id) / PDF_FILENAME,
+    }
+
+
+def touch(session_id):
+    """刷新会话的最后访问时间（以工作区目录的mtime记录）"""
+    work_dir = plan_dir(session_id)
+    if work_dir.exists():
+        os.utime(work_dir, None)
+
+
+def ensure_session(session_id=None):
+    """
+    获取可用的会话ID：传入合法ID则复用，否则新建
+    同时创建工作区和攻略目录，并顺带触发过期会话回收
+    """
+    if not is_valid_session_id(session_id):
+        session_id = uuid.uuid4().hex
+    plan_dir(session_id).mkdir(parents=True, exist_ok=True)
+    guides_dir(session_id).mkdir(parents=True, exist_ok=True)
+    touch(session_id)
+    maybe_gc()
+    return session_id
+
+
+def session_exists(session_id):
+    return is_valid_session_id(session_id) and plan_dir(session_id).exists()
+
+
+def gc_stale_sessions(max_age=None):
+    """删除超过max_age秒未访问的会话工作区，返回删除数量（攻略PDF由 gc_stale_guides 按 GUIDES_TTL 清理）"""
+    max_age = SESSION_TTL if max_age is None else max_age
+    if not PLAN_ROOT.exists():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for work_dir in PLAN_ROOT.iterdir():
+        try:
+            if work_dir.is_dir() and work_dir.stat().st_mtime < cutoff:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                removed += 1
+        except OSError as e:
+            print(f"清理会话目录失败: {work_dir} 原因: {e}")
+    return removed
+
+
+def _dir_usage(path):
+    """目录内文件总大小与最近修改时间"""
+    size, latest = 0, path.stat().st_mtime
+    for f in path.rglob("*"):
+        st = f.stat()
+        if f.is_file():
+            size += st.st_size
+        latest = max(latest, st.st_mtime)
+    return size, latest
+
+
+def gc_stale_guides(max_age=None, max_bytes=None):
+    """
+    清理已过期会话（工作区已删除）的攻略目录，返回删除数量：
+    超过max_age秒未更新的直接删除；其余攻略目录总大小超过max_bytes时，从最久未更新的过期会话开始删除
+    仍在使用的会话不删除
+    """
+    max_age = GUIDES_TTL if max_age is None else max_age
+    max_bytes = GUIDES_MAX_BYTES if max_bytes is None else max_bytes
+    if not GUIDES_ROOT.exists():
+        return 0
+    cutoff = time.time() - max_age
+    total = 0
+    candidates = []  # [(最近修改时间, 大小, 目录)]，过期会话中未超过max_age的攻略目录
+    removed = 0
+    for guide_dir in GUIDES_ROOT.iterdir():
+        try:
+            if not guide_dir.is_dir():
+                continue
+            size, latest = _dir_usage(guide_dir)
+            if is_valid_session_id(guide_dir.name) and plan_dir(guide_dir.name).exists():
+                total += size
+            elif latest < cutoff:
+                shutil.rmtree(guide_dir, ignore_errors=True)
+                removed += 1
+            else:
+                total += size
+                candidates.append((latest, size, guide_dir))
+        except OSError as e:
+            print(f"清理攻略目录失败: {guide_dir} 原因: {e}")
+    for _, size, guide_dir in sorted(candidates, key=lambda c: c[0]):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(guide_dir, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def maybe_gc():
+    """按GC_INTERVAL节流地执行过期会话与攻略目录回收"""
+    global _last_gc
+    now = time.time()
+    if now - _last_gc < GC_INTERVAL:
+        return
+    with _gc_lock:
+        if now - _last_gc < GC_INTERVAL:
+            return
+        _last_gc = now
+    removed = gc_stale_sessions()
+    if removed:
+        print(f"已清理过期会话: {removed} 个")
+    removed = gc_stale_guides()
+    if removed:
+        print(f"已清理过期攻略目录: {removed} 个")
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import airplane
+import railway
+import trip_extractor
+import timetable
+
+# 批量查票的最大并发数（每段行程一个请求，重复的查询由 ticket_cache 合并）
+PLAN_TICKET_WORKERS = int(os.getenv("PLAN_TICKET_WORKERS", 6))
+
+LEG_FIELDS = ("index", "mode", "date", "start", "end", "transport", "activity",
+              "time", "next_date", "next_time", "prefer_start", "prefer_end")
+
+
+def collect_legs(plan_path):
+    """
+    从旅行规划文件中找出所有飞机和火车行程（按行程表顺序）
+    :return: [{"index"（行程表行号）, "mode": "flight"/"train", "date", "start", "end", "transport", "activity",
+               "time", "next_date", "next_time", "prefer_start", "prefer_end"}, ...]
+    """
+    return [
+        {field: getattr(leg, field) for field in LEG_FIELDS}
+        for leg in trip_extractor.load_legs(plan_path, modes=("flight", "train"))
+    ]
+
+
+def search_leg(leg, sort_by=None):
+    """
+    查询一段行程的航班/车次并按规划时间段筛选
+    :param sort_by: None 保持接口顺序，或 price / duration / departure
+    :return: leg 的副本，附加 status（ok/empty/skipped/error）、message、total（筛选前数量）、results
+    """
+    result = dict(leg, status="ok", message="", total=0, results=[])
+    date, start_time = leg["date"], leg["time"]
+    is_return = "返程" in leg["activity"]
+    if leg["mode"] == "flight":
+        complete = leg["start"] and leg["end"] and date and start_time and (is_return or (leg["next_time"] and leg["next_date"]))
+    else:
+        complete = leg["start"] and leg["end"] and date and start_time and leg["next_time"] and leg["next_date"]
+    if not complete:
+        result.update(status="skipped", message="行程信息不完整")
+        return result
+
+    try:
+        if leg["mode"] == "flight":
+            items = airplane.query_flights(leg["prefer_start"] or leg["start"], leg["prefer_end"] or leg["end"], date)
+            kept, _ = timetable.select_in_window(
+                items, "flight", date, start_time,
+                leg["next_date"] or date, leg["next_time"] or start_time, sort_by=sort_by,
+            )
+        else:
+            items = railway.query_trains(leg["start"], leg["end"], date=date)
+            kept, _ = timetable.select_in_window(
+                items, "train", date, start_time, leg["next_date"], leg["next_time"], sort_by=sort_by,
+            )
+    except Exception as e:
+        result.update(status="error", message=str(e))
+        return result
+
+    result.update(total=len(items), results=kept)
+    if not kept:
+        result.update(status="empty", message="未查询到符合时间段的班次" if items else "未查询到班次")
+    return result
+
+
+def search_plan_tickets(plan_path, max_workers=None, sort_by=None):
+    """
+    对旅行规划中的每段飞机/火车行程并发查票，返回与 collect_legs 顺序一致的每段结果（见 search_leg）
+    """
+    legs = collect_legs(plan_path)
+    if not legs:
+        return []
+    start = time.perf_counter()
+    workers = max(1, min(max_workers or PLAN_TICKET_WORKERS, len(legs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda leg: search_leg(leg, sort_by=sort_by), legs))
+    print(f"[INFO] 行程查票: {len(legs)} 段，并发 {workers}，耗时 {time.perf_counter() - start:.2f}s")
+    return results
+
+
+if __name__ == "__main__":
+    plan_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(__file__), "../../temp/travel_plans/route_planning_LLMoutput.json")
+    for idx, leg in enumerate(search_plan_tickets(plan_path), 1):
+        print(f"\n[{idx}] {leg['date']} {leg['start']} → {leg['end']} {leg['transport']} "
+              f"{leg['status']} {leg['message']} 可选 {len(leg['results'])}/{leg['total']}")
@@ -1,13 +1,16 @@
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
 from pathlib import Path
 import fitz
 import os
-import gradio as gr
-import requests
-import sseclient
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import llm_client
+from embedding_engine import build_embedder
+from hybrid_retriever import HybridRetriever, BM25Index, build_bm25
+from answer_cache import replay
 import json
 
 # 远程 Qwen API 流式响应封装
@@ -29,130 +32,290 @@ import json
 #             {"role": "user", "content": prompt}
 #         ]
 #     }
-def stream_qwen_response(prompt):
-    import os
-    import requests
-    import json
-
+def stream_qwen_response(prompt, cancel_event=None, stats=None):
+    """
+    单次流式请求 Qwen 并逐段 yield 文本
+    :param cancel_event: 可选 threading.Event，置位后停止生成并关闭连接
+    :param stats: 可选 dict，结束时写入首 token 延迟和生成速度
+    """
     api_key = os.getenv("SILICON_API_KEY")
     if not api_key:
         raise ValueError("请设置 SILICON_API_KEY 环境变量")
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Accept": "text/event-stream",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "Qwen/Qwen3-8B",
-        "stream": True,
-        "messages": [
-            {"role": "system", "content": "你是一个友好的中文助手。"},
-            {"role": "user", "content": prompt}
-        ]
-    }
+    messages = [
+        {"role": "system", "content": "你是一个友好的中文助手。"},
+        {"role": "user", "content": prompt}
+    ]
+    yield from llm_client.chat_stream(messages, model="Qwen/Qwen3-8B", api_key=api_key,
+                                      cancel_event=cancel_event, stats=stats)
 
-    with requests.post("https://api.siliconflow.cn/v1/chat/completions", headers=headers, json=payload, stream=True) as response:
-        if response.status_code != 200:
-            raise RuntimeError(f"请求失败：{response.status_code} {response.text}")
-        response.encoding = "utf-8"
-        for line in response.iter_lines(decode_unicode=True):
-            if not line or not line.startswith("data: "):
-                continue
+# 以当前 travel.py 所在的 src 目录为基准
+SRC_DIR = Path(__file__).resolve().parent.parent
+EMBED_MODEL_PATH = SRC_DIR / "models" / "bge-small-zh"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
 
-            data = line.removeprefix("data: ").strip()
-            if data == "[DONE]":
-                break
+# 持久化索引目录：FAISS 索引 + 文本块存储（index.faiss / index.pkl）+ 清单 manifest.json
+RAG_INDEX_DIR = Path(os.getenv("RAG_INDEX_DIR", SRC_DIR.parent / "temp" / "rag_index"))
+MANIFEST_NAME = "manifest.json"
+BM25_NAME = "bm25.pkl"
 
-            try:
-                delta = json.loads(data)
-                content = delta.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                if content:
-                    yield content
-            except json.JSONDecodeError as e:
-                # 不再输出报错，避免污染 UI 显示
-                continue
+# PDF 解析并行进程数，0 表示使用全部 CPU 核心
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", 0)) or (os.cpu_count() or 1)
+# 解析进程的启动方式：spawn 或 forkserver（不用 fork，见 _make_pool）
+PDF_START_METHOD = os.getenv("PDF_START_METHOD", "spawn")
+
+def _extract_pdf_pages(path):
+    """在子进程中解析单个 PDF，返回 ([(页码, 文本), ...], 耗时秒数)"""
+    import time
+    start = time.perf_counter()
+    with fitz.open(path) as doc:
+        pages = [(i + 1, page.get_text()) for i, page in enumerate(doc)]
+    return pages, time.perf_counter() - start
+
+def _pages_to_documents(source, pages):
+    return [Document(page_content=text, metadata={"source": source, "page": page_no})
+            for page_no, text in pages if text.strip()]
+
+# 加载单个 PDF 文件（每页一个 Document）
+def load_pdf(file):
+    pages, _ = _extract_pdf_pages(str(file))
+    return _pages_to_documents(str(file), pages)
+
+def _make_pool(max_workers):
+    """
+    PDF 解析进程池：PyMuPDF 不支持多线程并发使用，多进程才能安全地利用多核。
+    不用 fork：界面和模型已加载、后台线程已运行时 fork 出的子进程可能死锁；
+    spawn/forkserver 子进程会重新导入主程序，travel.py 的界面与索引构建已放在 build_demo 中，不会重复执行
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(PDF_START_METHOD))
 
-    with requests.post("https://api.siliconflow.cn/v1/chat/completions", headers=headers, json=payload, stream=True) as response:
-        if response.status_code != 200:
-            raise RuntimeError(f"请求失败：{response.status_code} {response.text}")
-
-        # 检查是否为流式返回
-        if "text/event-stream" not in response.headers.get("Content-Type", ""):
-            raise RuntimeError(f"不是 SSE 流式返回，而是：{response.headers.get('Content-Type')}")
-        client = sseclient.SSEClient(response)
-        for event in client.events():
-            if event.data == "[DONE]":
-                break
+def iter_pdf_documents(files, max_workers=None, timings=None):
+    """
+    并行解析 PDF，按完成顺序逐个 yield (source, [每页 Document])，供下游边解析边切分
+    :param max_workers: 并行进程数，默认 PDF_WORKERS；为 1 或只有一个文件时在当前进程解析
+    :param timings: 可选 dict，写入每个文件的解析耗时（秒）
+    """
+    import time
+    from concurrent.futures import as_completed
+    files = [str(f) for f in files]
+    max_workers = min(max_workers or PDF_WORKERS, len(files))
+    start = time.perf_counter()
+    page_count = 0
+    if max_workers <= 1:
+        results = ((f, _run_inline(f)) for f in files)
+    else:
+        pool = _make_pool(max_workers)
+        futures = {pool.submit(_extract_pdf_pages, f): f for f in files}
+        results = ((futures[fut], fut) for fut in as_completed(futures))
+    try:
+        for source, outcome in results:
             try:
-                delta = json.loads(event.data)
-                content = delta.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                yield content
+                pages, elapsed = outcome.result()
             except Exception as e:
-                yield f"[流式解析错误] {e}"
+                print(f"读取失败: {source} 原因: {e}")
+                continue
+            if timings is not None:
+                timings[source] = elapsed
+            page_count += len(pages)
+            yield source, _pages_to_documents(source, pages)
+    finally:
+        if max_workers > 1:
+            pool.shutdown(cancel_futures=True)
+    if files:
+        print(f"[INFO] PDF解析: {len(files)} 个文件, {page_count} 页, 耗时 {time.perf_counter() - start:.2f}s, 进程数 {max(max_workers, 1)}")
+
+def _run_inline(path):
+    """在当前进程解析，返回与 Future 接口一致的对象"""
+    from concurrent.futures import Future
+    fut = Future()
+    try:
+        fut.set_result(_extract_pdf_pages(path))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
 
 # 加载 PDF 文件夹
-def load_pdfs_from_folder(folder_path):
+def load_pdfs_from_folder(folder_path, max_workers=None, timings=None):
     documents = []
-    for file in Path(folder_path).rglob("*.pdf"):
-        try:
-            text = ""
-            with fitz.open(str(file)) as doc:
-                for page in doc:
-                    text += page.get_text()
-            if text.strip():
-                documents.append(Document(page_content=text, metadata={"source": str(file)}))
-        except Exception as e:
-            print(f"读取失败: {file} 原因: {e}")
+    files = sorted(Path(folder_path).rglob("*.pdf"))
+    for _, docs in iter_pdf_documents(files, max_workers=max_workers, timings=timings):
+        documents.extend(docs)
     return documents
 
+def get_splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+def get_embedder():
+    # 使用绝对路径初始化嵌入模型（批大小、线程数、后端等见 embedding_engine）
+    return build_embedder(EMBED_MODEL_PATH)
+
 # 构建仅检索的向量检索器
 def build_retriever_from_docs(documents):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = splitter.split_documents(documents)
+    chunks = get_splitter().split_documents(documents)
     if not chunks:
         raise ValueError("文档内容为空，无法构建向量数据库")
 
-    # embedder = HuggingFaceEmbeddings(
-    #     model_name="./models/bge-small-zh",
-    #     model_kwargs={"device": "cpu"}
-    # )
+    vectordb = FAISS.from_documents(chunks, get_embedder())
+    return HybridRetriever(vectordb)
 
-    # 以当前 travel.py 所在的 src 目录为基准
-    src_dir = Path(__file__).resolve().parent.parent
-    model_path = src_dir / "models" / "bge-small-zh"
+def file_sha256(path, block_size=1 << 20):
+    """计算文件内容的 SHA-256（分块读取，避免大文件占用内存）"""
+    import hashlib
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
 
-    # 使用绝对路径初始化嵌入模型
-    embedder = HuggingFaceEmbeddings(
-        model_name=str(model_path),
-        model_kwargs={"device": "cpu"}
-    )
-    
+def _index_settings(embedder):
+    """影响向量结果的配置（嵌入模型、归一化、推理后端、切分参数）；任一项变化都需要全量重建"""
+    return {
+        **getattr(embedder, "settings", {"embedding_model": EMBED_MODEL_PATH.name}),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunk_unit": "page",
+    }
+
+def _scan_pdfs(folder_path, old_files):
+    """
+    扫描 PDF 并计算内容哈希，返回 {hash: {"sources": [...], "size":..., "mtime":...}}
+    文件大小与修改时间都未变化时直接复用清单中的哈希，不重新读取文件
+    """
+    known = {}
+    for file_hash, entry in old_files.items():
+        for source in entry.get("sources", []):
+            known[source] = (entry.get("size"), entry.get("mtime"), file_hash)
+    current = {}
+    for file in sorted(Path(folder_path).rglob("*.pdf")):
+        try:
+            stat = file.stat()
+            source = str(file)
+            cached = known.get(source)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+                file_hash = cached[2]
+            else:
+                file_hash = file_sha256(file)
+        except OSError as e:
+            print(f"读取失败: {file} 原因: {e}")
+            continue
+        entry = current.setdefault(file_hash, {"sources": [], "size": stat.st_size, "mtime": stat.st_mtime})
+        entry["sources"].append(source)
+    return current
 
+def build_or_load_retriever(folder_path, index_dir=None):
+    """
+    加载磁盘上的 FAISS 索引并增量更新：
+    仅对新增或内容变化的 PDF 重新切分和嵌入，删除已移除 PDF 的向量，然后保存回磁盘
+    清单按 PDF 内容哈希记录每个文件对应的向量 ID
+    """
+    index_dir = Path(index_dir or RAG_INDEX_DIR)
+    manifest_path = index_dir / MANIFEST_NAME
+    embedder = get_embedder()
+    settings = _index_settings(embedder)
 
-    vectordb = FAISS.from_documents(chunks, embedder)
-    return vectordb.as_retriever(search_kwargs={"k": 10})
+    vectordb = None
+    old_files = {}
+    if manifest_path.exists() and (index_dir / "index.faiss").exists():
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("settings") == settings:
+                vectordb = FAISS.load_local(str(index_dir), embedder, allow_dangerous_deserialization=True)
+                old_files = manifest.get("files", {})
+            else:
+                print("[INFO] 索引配置已变化，重新构建向量索引")
+        except Exception as e:
+            print(f"加载向量索引失败，重新构建: {e}")
+            vectordb, old_files = None, {}
+
+    current = _scan_pdfs(folder_path, old_files)
+    removed = [h for h in old_files if h not in current]
+    added = [h for h in current if h not in old_files]
+
+    # 删除已移除或内容已变化（哈希变化即视为旧文件移除）的 PDF 对应向量
+    stale_ids = [vid for h in removed for vid in old_files[h].get("ids", [])]
+    if vectordb is not None and stale_ids:
+        vectordb.delete(stale_ids)
+
+    files = {h: dict(old_files[h], sources=current[h]["sources"], size=current[h]["size"], mtime=current[h]["mtime"])
+             for h in current if h in old_files}
+    # 新增文件并行解析，每个文件解析完成即切分并嵌入
+    splitter = get_splitter()
+    source_to_hash = {current[h]["sources"][0]: h for h in added}
+    for source, docs in iter_pdf_documents(list(source_to_hash)):
+        file_hash = source_to_hash[source]
+        entry = current[file_hash]
+        chunks = splitter.split_documents(docs)
+        ids = [f"{file_hash}-{i}" for i in range(len(chunks))]
+        if chunks:
+            if vectordb is None:
+                vectordb = FAISS.from_documents(chunks, embedder, ids=ids)
+            else:
+                vectordb.add_documents(chunks, ids=ids)
+        files[file_hash] = dict(entry, ids=ids)
+
+    if vectordb is None or not any(entry.get("ids") for entry in files.values()):
+        raise ValueError("文档内容为空，无法构建向量数据库")
+
+    print(f"[INFO] 向量索引: 复用 {len(files) - len(added)} 个文件，新增/更新 {len(added)} 个，删除 {len(removed)} 个")
+    # 关键词索引与向量位置一一对应，向量有变化时重建
+    bm25_path = index_dir / BM25_NAME
+    changed = bool(added or removed) or not manifest_path.exists()
+    bm25 = None
+    if not changed and bm25_path.exists():
+        try:
+            bm25 = BM25Index.load(bm25_path)
+        except Exception as e:
+            print(f"加载关键词索引失败，重新构建: {e}")
+    if bm25 is None or len(bm25) != vectordb.index.ntotal:
+        bm25 = build_bm25(vectordb)
+        changed = True
+
+    if changed:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        vectordb.save_local(str(index_dir))
+        bm25.save(bm25_path)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "files": files}, f, ensure_ascii=False, indent=2)
+    return HybridRetriever(vectordb, bm25=bm25)
 
 # 构建搜索函数（对检索结果进行流式总结）
-def stream_search_docs(query, retriever):
-    results = retriever.invoke(query)  # 使用新版 API
-    if not results:
-        yield "未找到相关内容"
-        return
+def stream_search_docs(query, retriever, answer_cache=None):
+    """
+    检索并流式总结；传入 answer_cache（SemanticAnswerCache）时，
+    相同或语义相近的问题直接回放缓存的摘要，完整生成的摘要会写入缓存
+    """
+    if answer_cache is not None:
+        cached_answer = answer_cache.get(query)
+        if cached_answer:
+            yield from replay(cached_answer)
+            return
 
-    filtered = [doc for doc in results if query.lower() in doc.page_content.lower()]
-    if not filtered:
-        yield "未找到包含关键词的内容，请尝试换个表达"
+    # 混合检索已按关键词+向量融合分数排序并按阈值过滤，无需再按原文包含关系筛选
+    results = retriever.invoke(query)
+    if not results:
+        yield "未找到相关内容，请尝试换个表达"
         return
 
-    combined_text = "\n".join(doc.page_content[:1000] for doc in filtered[:5])
+    combined_text = "\n".join(doc.page_content[:1000] for doc in results)
+    chunks = []
+    stats = {}
     try:
         prompt = f"请根据以下内容生成简洁清晰的旅游推荐摘要：\n\n{combined_text}\n\n摘要："
-        for chunk in stream_qwen_response(prompt):
+        for chunk in stream_qwen_response(prompt, stats=stats):
+            chunks.append(chunk)
             yield chunk
     except Exception as e:
         #yield f"大模型总结失败：{e}，改为显示原文：\n\n{combined_text}"
         return
+    if stats.get("ttft") is not None:
+        print(f"[INFO] 摘要生成: 首字延迟 {stats['ttft']:.2f}s, {stats['tokens_per_s']:.1f} tokens/s")
+    # 仅缓存完整生成的摘要（中途出错或客户端断开不会执行到这里）
+    if answer_cache is not None:
+        answer_cache.set(query, "".join(chunks))
 
 # 加载环境变量
 def load_env(filepath):
@@ -169,6 +332,9 @@ def load_env(filepath):
     return env
 
 if __name__ == "__main__":
+    # 界面只在直接运行本模块时使用；放在这里导入，PDF 解析子进程导入本模块时无需加载 gradio
+    import gradio as gr
+
     env_path = Path(__file__).resolve().parent.parent / "API.env"
     env_vars = load_env(env_path)
     os.environ.update(env_vars)
@@ -176,24 +342,14 @@ if __name__ == "__main__":
     dataset_dir = Path(__file__).resolve().parent.parent / "dataset"
     #dataset_dir = Path("./dataset").resolve()
     #dataset_dir = Path("dataset").resolve()
-    rag_docs = load_pdfs_from_folder(dataset_dir)
-    if not rag_docs:
-        raise RuntimeError("PDF 文件夹中未成功加载任何文档，请检查 dataset 路径与 PDF 内容")
-    retriever = build_retriever_from_docs(rag_docs)
-
     # dataset_dir = Path(__file__).resolve().parent.parent / "dataset"
     # # 打印调试信息，方便排查问题
     # print(f"📂 正在加载 dataset 文件夹路径: {dataset_dir}")
     # if not dataset_dir.exists():
     #     raise FileNotFoundError(f"找不到 dataset 文件夹，请确认路径是否存在: {dataset_dir}")
 
-    # 加载 PDF 文档
-    rag_docs = load_pdfs_from_folder(dataset_dir)
-    if not rag_docs:
-        raise RuntimeError("❌ PDF 文件夹中未成功加载任何文档，请检查 dataset 路径与 PDF 内容")
-
-    # 构建检索器
-    retriever = build_retriever_from_docs(rag_docs)
+    # 加载（或增量构建）检索器
+    retriever = build_or_load_retriever(dataset_dir)
 
     with gr.Blocks() as demo:
         with gr.Tab("📚 文档问答助手"):
@@ -3,12 +3,42 @@ import sys
 import json
 import os
 from dotenv import load_dotenv
+import http_client
+import place_resolver
+from ticket_cache import ticket_cached
+import trip_extractor
+import timetable
+import fares
 
 # 加载API.env
 env_path = os.path.join(os.path.dirname(__file__), '../../API.env')
 load_dotenv(env_path)
 RAILWAY_APPCODE = os.getenv("RAILWAY_APPCODE")
 
+def resolve_train_place(name):
+    """
+    将出发地/目的地解析为火车票接口可识别的车站名或城市名
+    - 含中文的地名只接受车站表/城市的精确匹配（如“上海虹桥站”→“上海虹桥”），未收录的原样返回，
+      不做包含或模糊匹配，避免“曲阜东”被改写成“济宁”这类其他车站
+    - 拼音、英文名支持模糊匹配（如“shanghai hongqiao”→“上海虹桥”，“chengdu”→“成都”），无法识别的返回空字符串
+    """
+    resolver = place_resolver.get_resolver()
+    if place_resolver.has_cjk(name):
+        place = resolver.exact(name, kinds=("station", "city"))
+        return place["name"] if place else name.strip()
+    place = resolver.best(name, kinds=("station", "city", "airport"))
+    if place:
+        return place["name"] if place["kind"] in ("station", "city") else place["city"]
+    return ""
+
+def train_query_key(start, end, date=None, ishigh=None, appcode=None):
+    """火车票查询的缓存键：按解析后的站名/城市名和筛选条件"""
+    start, end = resolve_train_place(start), resolve_train_place(end)
+    if not start or not end:
+        return None
+    return (start, end, date or "", "" if ishigh is None else str(ishigh))
+
+@ticket_cached("trains", train_query_key)
 def query_trains(start, end, date=None, ishigh=None, appcode=None):
     """
     查询两地间可选火车班次
@@ -19,7 +49,13 @@ def query_trains(start, end, date=None, ishigh=None, appcode=None):
     :param appcode: 阿里云市场AppCode（可选，默认读取环境变量）
     :return: 返回火车班次信息的列表
     """
-    import urllib.parse
+    # 本地先解析地名，无法识别的查询不调用付费接口
+    resolved_start, resolved_end = resolve_train_place(start), resolve_train_place(end)
+    if not resolved_start or not resolved_end:
+        print(f"无法识别的出发地或目的地: {start} 或 {end}")
+        return []
+    start, end = resolved_start, resolved_end
+
     url_host = 'http://jisutrainf.market.alicloudapi.com'
     url_path = '/train/station2s'
     url = url_host + url_path
@@ -33,10 +69,6 @@ def query_trains(start, end, date=None, ishigh=None, appcode=None):
     if ishigh is not None:
         params["ishigh"] = str(ishigh)
 
-    # urlencode参数
-    querys = urllib.parse.urlencode(params)
-    full_url = url + '?' + querys
-
     # 优先使用传入的appcode，否则用环境变量
     if appcode is None:
         appcode = RAILWAY_APPCODE
@@ -49,13 +81,11 @@ def query_trains(start, end, date=None, ishigh=None, appcode=None):
     }
 
     try:
-        import urllib.request
-        req = urllib.request.Request(full_url, headers=headers)
-        response = urllib.request.urlopen(req)
-        content = response.read()
-        if isinstance(content, bytes):
-            content = content.decode("utf-8")
-        data = json.loads(content)
+        # 通过共享连接池请求（复用keep-alive连接）
+        # 按次计费的接口不自动重试（超时重试可能重复计费），失败由车票缓存下次重新查询
+        response = http_client.get(url, params=params, headers=headers, retries=0)
+        response.raise_for_status()
+        data = json.loads(response.content.decode("utf-8"))
         if data.get("status") == 0 and "result" in data:
             # result直接就是list
             if isinstance(data["result"], list):
@@ -74,114 +104,14 @@ def query_trains(start, end, date=None, ishigh=None, appcode=None):
 
 def extract_train_trips_from_plan(plan_path):
     """
-    从旅行规划文件中提取需要乘坐火车/高铁/动车的日程
+    从旅行规划文件中提取需要乘坐火车/高铁/动车的日程（解析与目的地识别见 trip_extractor.extract_trips）
     :param plan_path: 旅行规划json文件路径
     :return: [(date, start, end, transport, activity, time, next_time, next_date), ...]
     """
-    trips = []
-    keywords = ["火车", "高铁", "动车"]
-    if not os.path.exists(plan_path):
-        print(f"未找到旅行规划文件: {plan_path}")
-        return trips
-    with open(plan_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    for idx, line in enumerate(lines):
-        try:
-            item = json.loads(line)
-        except Exception:
-            try:
-                item = json.loads(line.strip().rstrip(","))
-            except Exception:
-                continue
-        transport = item.get("transport", "")
-        if any(k in transport for k in keywords):
-            date = item.get("date", "")
-            start = item.get("location", "")
-            activity = item.get("activity", "")
-            time = item.get("time", "")
-            # 目的地一般在“前往XXX”或“到达XXX”
-            import re
-            m = re.search(r"(前往|到达)([\u4e00-\u9fa5]+)", activity)
-            if m:
-                end = m.group(2)
-            else:
-                end = ""
-            # 查找下一条的时间和日期作为到达时间和到达日期
-            next_time = ""
-            next_date = date
-            if idx + 1 < len(lines):
-                try:
-                    next_item = json.loads(lines[idx + 1])
-                except Exception:
-                    try:
-                        next_item = json.loads(lines[idx + 1].strip().rstrip(","))
-                    except Exception:
-                        next_item = {}
-                if next_item.get("date", ""):
-                    next_date = next_item.get("date", date)
-                    next_time = next_item.get("time", "")
-            trips.append((date, start, end, transport, activity, time, next_time, next_date))
-    return trips
-
-def time_in_range(start_time, end_time, check_time):
-    """
-    判断check_time是否在[start_time, end_time]区间内
-    时间格式: "HH:MM"
-    """
-    try:
-        from datetime import datetime
-        t_format = "%H:%M"
-        t0 = datetime.strptime(start_time, t_format)
-        t1 = datetime.strptime(end_time, t_format)
-        t = datetime.strptime(check_time, t_format)
-        return t0 <= t <= t1
-    except Exception:
-        return False
-
-def datetime_less_than(date1, time1, date2, time2):
-    """
-    判断date1 time1 是否早于 date2 time2
-    日期格式: YYYY-MM-DD，时间格式: HH:MM
-    """
-    try:
-        from datetime import datetime
-        dt_format = "%Y-%m-%d %H:%M"
-        dt1 = datetime.strptime(f"{date1} {time1}", dt_format)
-        dt2 = datetime.strptime(f"{date2} {time2}", dt_format)
-        return dt1 < dt2
-    except Exception:
-        return False
-
-def datetime_in_range(dep_date, dep_time, arr_date, arr_time, plan_dep_date, plan_dep_time, plan_arr_date, plan_arr_time):
-    """
-    检查火车的出发/到达日期时间是否在规划的区间内
-    """
-    try:
-        from datetime import datetime
-        dt_format = "%Y-%m-%d %H:%M"
-        train_dep = datetime.strptime(f"{dep_date} {dep_time}", dt_format)
-        train_arr = datetime.strptime(f"{arr_date} {arr_time}", dt_format)
-        plan_dep = datetime.strptime(f"{plan_dep_date} {plan_dep_time}", dt_format)
-        plan_arr = datetime.strptime(f"{plan_arr_date} {plan_arr_time}", dt_format)
-        # 要求：出发时间>=规划出发，且到达时间<=规划到达，且出发时间<到达时间
-        return (train_dep >= plan_dep) and (train_arr <= plan_arr) and (train_dep < train_arr)
-    except Exception:
-        return False
-
-def add_day_if_needed(dep_time, arr_time):
-    """
-    判断到达时间是否跨天（如出发时间11:20，到达时间04:45，说明到达是次日），
-    如果是，返回1，否则返回0
-    """
-    try:
-        from datetime import datetime
-        t_format = "%H:%M"
-        t_dep = datetime.strptime(dep_time, t_format)
-        t_arr = datetime.strptime(arr_time, t_format)
-        # 到达时间小于出发时间，说明跨天
-        return 1 if t_arr < t_dep else 0
-    except Exception:
-        return 0
+    return [
+        (leg.date, leg.start, leg.end, leg.transport, leg.activity, leg.time, leg.next_time, leg.next_date)
+        for leg in trip_extractor.load_legs(plan_path, modes=("train",))
+    ]
 
 if __name__ == "__main__":
     # 新增：自动读取旅行规划并检索火车票
@@ -199,44 +129,12 @@ if __name__ == "__main__":
             print(f"\n[{idx}] {date} {start} → {end} 交通方式: {transport} 活动: {activity} 时间段: {date} {time}~{next_date} {next_time}")
             try:
                 trains = query_trains(start, end, date=date)
-                filtered_trains = []
-                for train in trains:
-                    dep_time = train.get("departuretime", "")
-                    arr_time = train.get("arrivaltime", "")
-                    if dep_time and arr_time:
-                        # 计算到达日期
-                        from datetime import datetime, timedelta
-                        add_days = add_day_if_needed(dep_time, arr_time)
-                        arr_date = date
-                        if add_days:
-                            arr_date = (datetime.strptime(date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-                        # 判断火车的出发/到达是否在规划区间内（允许跨天）
-                        if datetime_in_range(date, dep_time, arr_date, arr_time, date, time, next_date, next_time):
-                            filtered_trains.append(train)
+                # 按规划时间段筛选（跨天到达自动顺延一天）
+                filtered_trains, _ = timetable.select_in_window(trains, "train", date, time, next_date, next_time)
                 if not filtered_trains:
                     print("  未查询到符合时间段的火车班次。")
                 else:
-                    for train in filtered_trains:
-                        price_info = []
-                        price_fields = [
-                            ("pricesw", "商务座"),
-                            ("pricetd", "特等座"),
-                            ("pricegr1", "高级软卧上铺"),
-                            ("pricegr2", "高级软卧下铺"),
-                            ("pricerw1", "软卧上铺"),
-                            ("pricerw2", "软卧下铺"),
-                            ("priceyw1", "硬卧上铺"),
-                            ("priceyw2", "硬卧中铺"),
-                            ("priceyw3", "硬卧下铺"),
-                            ("priceyd", "一等座"),
-                            ("priceed", "二等座"),
-                        ]
-                        for key, label in price_fields:
-                            value = train.get(key, "")
-                            value_str = str(value).strip()
-                            if value_str and value_str != "0.0" and value_str != "-":
-                                price_info.append(f"{label}:{value_str}元")
-                        price_str = " ".join(price_info)
-                        print(f"  {train.get('trainno','')} {train.get('type','')} {train.get('departuretime','')}→{train.get('arrivaltime','')} 历时{train.get('costtime','')} {price_str}")
+                    table = fares.to_display(fares.build_train_fares(filtered_trains))
+                    print(table.to_string(index=False))
             except Exception as e:
                 print(f"  查询失败: {e}")
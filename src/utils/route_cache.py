@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_store import CACHE_DIR, PersistentCache, make_key
+import route_geometry
+
+# 路线缓存配置：驾车/步行路线较稳定，公交受班次和实时路况影响，TTL 更短（秒）
+ROUTE_CACHE_PATH = os.getenv("ROUTE_CACHE_PATH", os.path.join(CACHE_DIR, "route_cache.sqlite3"))
+ROUTE_CACHE_TTL = {
+    "driving": int(os.getenv("ROUTE_CACHE_TTL_DRIVING", 6 * 3600)),
+    "walking": int(os.getenv("ROUTE_CACHE_TTL_WALKING", 24 * 3600)),
+    "transit": int(os.getenv("ROUTE_CACHE_TTL_TRANSIT", 30 * 60)),
+}
+ROUTE_CACHE_MEMORY_SIZE = int(os.getenv("ROUTE_CACHE_MEMORY_SIZE", 256))
+ROUTE_CACHE_MAX_ROWS = int(os.getenv("ROUTE_CACHE_MAX_ROWS", 5000))
+# 坐标吸附精度（小数位）：4 位约 10 米，附近的起终点共用同一条缓存
+ROUTE_SNAP_DECIMALS = int(os.getenv("ROUTE_SNAP_DECIMALS", 4))
+# 多段路线并发计算的最大并发数（实际速率仍受按 Key 限流约束）
+ROUTE_LEG_WORKERS = int(os.getenv("ROUTE_LEG_WORKERS", 6))
+
+ROUTE_CACHE = PersistentCache(
+    ROUTE_CACHE_PATH,
+    ttl=ROUTE_CACHE_TTL["driving"],
+    memory_size=ROUTE_CACHE_MEMORY_SIZE,
+    max_rows=ROUTE_CACHE_MAX_ROWS,
+)
+
+
+def snap(coords, decimals=ROUTE_SNAP_DECIMALS):
+    """把 (经度, 纬度) 吸附到固定精度"""
+    return tuple(round(float(c), decimals) for c in coords)
+
+
+def route_key(mode, start_coords, end_coords, *extra):
+    return make_key(mode, snap(start_coords), snap(end_coords), *extra)
+
+
+def get_route(mode, start_coords, end_coords, compute, *extra):
+    """
+    查询路线缓存，未命中时调用 compute(*start_coords, *end_coords, *extra) 计算
+    仅缓存成功结果；写入前附带解码并简化好的折线（map_points/map_zoom），命中时可直接绘图
+    :param mode: driving / transit / walking，决定 TTL
+    :param extra: 影响结果的其他参数（如公交城市），参与缓存键
+    :return: 结果 dict 的浅拷贝，调用方可自由修改顶层字段
+    """
+    key = route_key(mode, start_coords, end_coords, *extra)
+    hit, result = ROUTE_CACHE.get(mode, key)
+    if hit:
+        print(f"路线缓存命中: {mode} {key}")
+        return dict(result)
+    result = compute(*start_coords, *end_coords, *extra)
+    if result.get("success"):
+        points, zoom = route_geometry.prepare_map_points(result.get("polyline", ""))
+        result["map_points"] = points.tolist()
+        result["map_zoom"] = zoom
+        ROUTE_CACHE.set(mode, key, result, ROUTE_CACHE_TTL.get(mode))
+    return dict(result)
+
+
+def map_legs(compute_leg, points, max_workers=None):
+    """
+    并发计算相邻两点间的各段路线，按顺序返回结果
+    :param compute_leg: compute_leg(起点, 终点) -> 单段结果
+    :param points: 途经点列表（至少两个）
+    :param max_workers: 最大并发数，默认 ROUTE_LEG_WORKERS
+    """
+    pairs = list(zip(points[:-1], points[1:]))
+    if not pairs:
+        return []
+    workers = min(max_workers or ROUTE_LEG_WORKERS, len(pairs))
+    if workers <= 1:
+        return [compute_leg(a, b) for a, b in pairs]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda pair: compute_leg(*pair), pairs))
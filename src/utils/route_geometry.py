@@ -0,0 +1,113 @@
+import os
+import re
+
+import numpy as np
+
+# 简化容差（屏幕像素）：小于该偏差的折线细节在地图上不可见
+SIMPLIFY_PIXEL_TOLERANCE = float(os.getenv("SIMPLIFY_PIXEL_TOLERANCE", 1.0))
+# 按初始缩放级别再放大几级来计算容差，保证用户放大查看时折线仍然平滑
+SIMPLIFY_ZOOM_MARGIN = int(os.getenv("SIMPLIFY_ZOOM_MARGIN", 2))
+
+# Web 墨卡托 0 级下赤道处每像素对应的米数（256 像素瓦片）
+_METERS_PER_PIXEL_Z0 = 156543.03392
+_METERS_PER_DEG_LAT = 110540.0
+_METERS_PER_DEG_LNG = 111320.0
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def decode_polyline(polyline_str):
+    """
+    解码高德 polyline 字符串（"lng,lat;lng,lat;..."，多段以分号拼接）
+    :return: (N, 2) float64 数组，每行为 [纬度, 经度]（Folium 顺序）；空串或无法解析时返回 (0, 2) 数组
+    """
+    if not polyline_str:
+        return np.empty((0, 2))
+    values = _NUMBER_RE.findall(polyline_str)
+    if len(values) % 2:
+        values = values[:-1]
+    coords = np.array(values, dtype=np.float64).reshape(-1, 2)
+    return np.ascontiguousarray(coords[:, ::-1])
+
+
+def meters_per_pixel(zoom, lat):
+    """给定缩放级别和纬度下每个屏幕像素对应的地面距离（米）"""
+    return _METERS_PER_PIXEL_Z0 * np.cos(np.radians(lat)) / (2 ** zoom)
+
+
+def _project(points):
+    """以折线中心纬度做等距投影，把 [纬度, 经度] 转为平面米坐标"""
+    lat0 = np.radians(points[:, 0].mean())
+    x = points[:, 1] * _METERS_PER_DEG_LNG * np.cos(lat0)
+    y = points[:, 0] * _METERS_PER_DEG_LAT
+    return np.column_stack([x, y])
+
+
+def douglas_peucker(points, tolerance):
+    """
+    Douglas-Peucker 折线简化（非递归，每段的点到线距离用 NumPy 向量化计算）
+    :param points: (N, 2) 平面坐标数组
+    :param tolerance: 允许的最大偏差（与坐标同单位）
+    :return: 保留点的下标布尔掩码
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        seg = points[first + 1:last]
+        a, b = points[first], points[last]
+        ab = b - a
+        length = np.hypot(ab[0], ab[1])
+        if length == 0:
+            dists = np.hypot(seg[:, 0] - a[0], seg[:, 1] - a[1])
+        else:
+            dists = np.abs(ab[0] * (seg[:, 1] - a[1]) - ab[1] * (seg[:, 0] - a[0])) / length
+        idx = int(np.argmax(dists))
+        if dists[idx] > tolerance:
+            split = first + 1 + idx
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def simplify_polyline(points, zoom, pixel_tolerance=SIMPLIFY_PIXEL_TOLERANCE):
+    """
+    按缩放级别简化折线：偏差不超过 pixel_tolerance 个屏幕像素的点被去掉
+    :param points: (N, 2) [纬度, 经度] 数组
+    :return: 简化后的 (M, 2) 数组，始终保留首尾点
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) <= 2:
+        return points
+    tolerance = pixel_tolerance * meters_per_pixel(zoom, points[:, 0].mean())
+    return points[douglas_peucker(_project(points), tolerance)]
+
+
+def zoom_for_extent(points):
+    """根据折线经纬度范围估算合适的初始缩放级别"""
+    if len(points) < 2:
+        return 13
+    span = np.ptp(points, axis=0).max()
+    if span > 1:
+        return 8
+    if span > 0.1:
+        return 10
+    if span > 0.01:
+        return 13
+    return 15
+
+
+def prepare_map_points(polyline_str):
+    """
+    解码并按地图初始缩放级别简化折线
+    :return: (简化后的 (M, 2) 数组, 初始缩放级别)
+    """
+    points = decode_polyline(polyline_str)
+    zoom = zoom_for_extent(points)
+    return simplify_polyline(points, zoom + SIMPLIFY_ZOOM_MARGIN), zoom
@@ -1,4 +1,5 @@
-import requests
+import llm_client
+from json_stream import iter_json_objects
 import os
 import json
 import time
@@ -20,92 +21,44 @@ def get_chat_response(messages, model_name=MODEL_NAME, api_key=API_KEY, api_url=
     :param api_url: API地址
     :return: 大模型回复内容字符串
     """
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": model_name,
-        "messages": messages
-    }
     try:
-        response = requests.post(api_url, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+        return llm_client.chat(messages, model=model_name, api_key=api_key, api_url=api_url)
     except Exception as e:
         return f"Error: {str(e)}"
 
-def get_chat_response_stream(messages, model_name=MODEL_NAME, api_key=API_KEY, api_url=API_URL):
+def get_chat_response_stream(messages, model_name=MODEL_NAME, api_key=API_KEY, api_url=API_URL, cancel_event=None):
     """
     通用大模型对话接口（流式输出）
     :param messages: 消息列表 [{"role": "system"/"user"/"assistant", "content": "..."}]
+    :param cancel_event: 可选 threading.Event，置位后停止生成并关闭连接
     :return: 逐步yield大模型回复内容
     """
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": model_name,
-        "messages": messages,
-        "stream": True
-    }
     try:
-        with requests.post(api_url, headers=headers, json=data, stream=True, timeout=120) as resp:
-            resp.raise_for_status()
-            buffer = ""
-            for line in resp.iter_lines():
-                if not line:
-                    continue
-                # 强制用utf-8解码每一行
-                if isinstance(line, bytes):
-                    line = line.decode("utf-8", errors="replace")
-                if not line.startswith("data:"):
-                    continue
-                content = line[len("data:"):].strip()
-                if content == "[DONE]":
-                    break
-                try:
-                    chunk = json.loads(content)
-                    delta = chunk.get("choices", [{}])[0].get("delta", {})
-                    if "content" in delta:
-                        buffer += delta["content"]
-                        # 尝试逐步解析JSON对象（假设每一行为一个JSON对象，或以换行分隔）
-                        while True:
-                            json_start = buffer.find('{')
-                            json_end = buffer.find('}', json_start)
-                            if json_start != -1 and json_end != -1:
-                                try:
-                                    obj = json.loads(buffer[json_start:json_end+1])
-                                    yield obj
-                                    buffer = buffer[json_end+1:]
-                                except Exception:
-                                    break
-                            else:
-                                break
-                except Exception:
-                    continue
+        deltas = llm_client.chat_stream(messages, model=model_name, api_key=api_key, api_url=api_url,
+                                        cancel_event=cancel_event)
+        # 增量解析：每个行程对象的右括号到达即yield，支持嵌套、转义和代码块包裹
+        yield from iter_json_objects(deltas)
     except Exception as e:
         yield {"error": str(e)}
 
-def main():
-    # 读取GUI输出（目录变更）
-    base_dir = os.path.join(os.path.dirname(__file__), '../../temp/travel_plans')
-    gui_path = os.path.join(base_dir, "route_planning_GUIoutput.json")
-    llm_path = os.path.join(base_dir, "route_planning_LLMoutput.json")
-    with open(gui_path, "r", encoding="utf-8") as f:
-        gui_data = json.load(f)
-
-    # 新输入协议：departure, departure_date, return_date, destinations:[{"place": ...}, ...]
-    departure = gui_data.get("departure", "")
-    departure_date = gui_data.get("departure_date", "")
-    return_date = gui_data.get("return_date", "")
-    destinations = gui_data.get("destinations", [])
+def normalize_item(item):
+    """统一行程条目的键（兼容中文键），保证输出协议为 date, time, location, activity, transport"""
+    return {
+        "date": item.get("date") or item.get("日期", ""),
+        "time": item.get("time") or item.get("时间", ""),
+        "location": item.get("location") or item.get("地点", ""),
+        "activity": item.get("activity") or item.get("活动", ""),
+        "transport": item.get("transport") or item.get("交通", "")
+    }
 
-    # 构造用户需求描述（包含返程日期）
+def build_plan_messages(departure, departure_date, return_date, destinations):
+    """
+    根据GUI输入构造行程规划的对话消息
+    :param destinations: [{"place": ...}, ...] 或地名字符串列表
+    """
     dest_desc = []
     for dest in destinations:
-        place = dest.get("place", "")
+        place = dest.get("place", "") if isinstance(dest, dict) else str(dest)
         dest_desc.append(f"{place}")
     dest_str = "，".join(dest_desc)
 
@@ -117,43 +70,59 @@ def main():
         "请不要输出除JSON以外的内容。"
     )
 
-    # 构造消息
-    messages = [
+    return [
         {"role": "system", "content": "你是一个专业的中文旅行规划助手，善于为用户自动推荐景点并生成详细行程。"},
         {"role": "user", "content": user_text}
     ]
 
+def stream_travel_plan(departure, departure_date, return_date, destinations, **kwargs):
+    """
+    进程内流式生成行程：每解析出一个行程条目立即yield标准化后的dict
+    出错时yield {"error": ...}，调用方自行决定如何展示
+    """
+    messages = build_plan_messages(departure, departure_date, return_date, destinations)
+    for item in get_chat_response_stream(messages, **kwargs):
+        if not isinstance(item, dict):
+            continue
+        if item.get("error"):
+            yield item
+        else:
+            yield normalize_item(item)
+
+async def astream_travel_plan(departure, departure_date, return_date, destinations, **kwargs):
+    """stream_travel_plan 的异步迭代器版本：在线程中推进同步生成器，不阻塞事件循环"""
+    import asyncio
+    gen = stream_travel_plan(departure, departure_date, return_date, destinations, **kwargs)
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, gen, done)
+        if item is done:
+            break
+        yield item
+
+def main():
+    # 读取GUI输出（目录变更）
+    base_dir = os.path.join(os.path.dirname(__file__), '../../temp/travel_plans')
+    gui_path = os.path.join(base_dir, "route_planning_GUIoutput.json")
+    llm_path = os.path.join(base_dir, "route_planning_LLMoutput.json")
+    with open(gui_path, "r", encoding="utf-8") as f:
+        gui_data = json.load(f)
+
+    # 新输入协议：departure, departure_date, return_date, destinations:[{"place": ...}, ...]
+    departure = gui_data.get("departure", "")
+    departure_date = gui_data.get("departure_date", "")
+    return_date = gui_data.get("return_date", "")
+    destinations = gui_data.get("destinations", [])
+
     # 仅保留流式获取大模型回复
     with open(llm_path, "w", encoding="utf-8") as f:
-        for item in get_chat_response_stream(messages):
-            if isinstance(item, dict) and not item.get("error"):
-                # 保证输出协议
-                def normalize_item(item):
-                    key_map = {
-                        "日期": "date",
-                        "date": "date",
-                        "时间": "time",
-                        "time": "time",
-                        "地点": "location",
-                        "location": "location",
-                        "活动": "activity",
-                        "activity": "activity",
-                        "交通": "transport",
-                        "transport": "transport"
-                    }
-                    return {
-                        "date": item.get("date") or item.get("日期", ""),
-                        "time": item.get("time") or item.get("时间", ""),
-                        "location": item.get("location") or item.get("地点", ""),
-                        "activity": item.get("activity") or item.get("活动", ""),
-                        "transport": item.get("transport") or item.get("交通", "")
-                    }
-                normed = normalize_item(item)
-                f.write(json.dumps(normed, ensure_ascii=False) + "\n")
-                f.flush()
-            elif isinstance(item, dict) and item.get("error"):
+        for item in stream_travel_plan(departure, departure_date, return_date, destinations):
+            if item.get("error"):
                 print(f"流式大模型错误: {item['error']}")
+                continue
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            f.flush()
     print(f"流式行程规划已保存至: {llm_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,149 @@
+import io
+import math
+import base64
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import route_geometry
+import tile_cache
+
+TILE_SIZE = 256
+MAX_ZOOM = 18
+STATIC_MAP_SIZE = (1200, 800)
+STATIC_MAP_PADDING = 60
+JPEG_QUALITY = 90
+
+BASEMAP_COLOR = (242, 239, 233)
+GRID_COLOR = (226, 222, 214)
+ROUTE_COLORS = {
+    "driving": (24, 144, 255),
+    "transit": (255, 107, 107),
+    "walking": (82, 196, 26),
+}
+ROUTE_TYPE_ALIASES = {"驾车": "driving", "公交": "transit", "步行": "walking"}
+LEG_PALETTE = [(250, 140, 22), (114, 46, 209), (19, 194, 194)]
+
+
+def latlng_to_pixels(lat, lng, zoom):
+    """经纬度转 Web 墨卡托全局像素坐标（支持 NumPy 数组）"""
+    scale = TILE_SIZE * (2 ** zoom)
+    lat = np.clip(lat, -85.05112878, 85.05112878)
+    x = (np.asarray(lng) + 180.0) / 360.0 * scale
+    sin_lat = np.sin(np.radians(lat))
+    y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def fit_zoom(points, size, padding):
+    """能把所有点放进画布（留出边距）的最大缩放级别"""
+    avail_w, avail_h = size[0] - 2 * padding, size[1] - 2 * padding
+    for zoom in range(MAX_ZOOM, 0, -1):
+        x, y = latlng_to_pixels(points[:, 0], points[:, 1], zoom)
+        if np.ptp(x) <= avail_w and np.ptp(y) <= avail_h:
+            return zoom
+    return 1
+
+
+def load_cached_tile(z, x, y):
+    """读取本地缓存的瓦片（不联网），不存在或损坏时返回 None"""
+    data = tile_cache.read_cached_tile(z, x, y)
+    if data is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as tile:
+            return tile.convert("RGB")
+    except OSError:
+        return None
+
+
+def _draw_basemap(image, zoom, origin_x, origin_y, tile_loader):
+    """按瓦片网格铺底图：有瓦片贴瓦片，没有则画网格线"""
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+    tiles = 2 ** zoom
+    for tx in range(int(origin_x // TILE_SIZE), int((origin_x + width) // TILE_SIZE) + 1):
+        for ty in range(int(origin_y // TILE_SIZE), int((origin_y + height) // TILE_SIZE) + 1):
+            left, top = int(tx * TILE_SIZE - origin_x), int(ty * TILE_SIZE - origin_y)
+            tile = tile_loader(zoom, tx % tiles, ty) if tile_loader and 0 <= ty < tiles else None
+            if tile is not None:
+                image.paste(tile, (left, top))
+            else:
+                draw.rectangle([left, top, left + TILE_SIZE, top + TILE_SIZE], outline=GRID_COLOR)
+
+
+def _draw_marker(draw, xy, fill, radius=9):
+    x, y = xy
+    draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=fill, outline=(255, 255, 255), width=3)
+
+
+def render_route(lines, markers=(), size=STATIC_MAP_SIZE, padding=STATIC_MAP_PADDING, tile_loader=load_cached_tile):
+    """
+    离线绘制路线图
+    :param lines: [((N, 2) [纬度, 经度] 数组, RGB颜色), ...]
+    :param markers: [(纬度, 经度, RGB颜色), ...]
+    :return: PIL.Image（RGB）
+    """
+    arrays = [np.asarray(pts, dtype=np.float64).reshape(-1, 2) for pts, _ in lines]
+    marker_pts = np.array([[lat, lng] for lat, lng, _ in markers], dtype=np.float64).reshape(-1, 2)
+    all_pts = np.vstack(arrays + [marker_pts])
+    if not len(all_pts):
+        raise ValueError("没有可绘制的坐标")
+    zoom = fit_zoom(all_pts, size, padding)
+
+    x, y = latlng_to_pixels(all_pts[:, 0], all_pts[:, 1], zoom)
+    origin_x = (x.min() + x.max()) / 2 - size[0] / 2
+    origin_y = (y.min() + y.max()) / 2 - size[1] / 2
+
+    image = Image.new("RGB", size, BASEMAP_COLOR)
+    _draw_basemap(image, zoom, origin_x, origin_y, tile_loader)
+    draw = ImageDraw.Draw(image)
+
+    def to_canvas(pts):
+        px, py = latlng_to_pixels(pts[:, 0], pts[:, 1], zoom)
+        return list(zip((px - origin_x).tolist(), (py - origin_y).tolist()))
+
+    for pts, (_, color) in zip(arrays, lines):
+        if len(pts) < 2:
+            continue
+        # 按实际缩放级别再简化一次，像素级误差不可见
+        xy = to_canvas(route_geometry.simplify_polyline(pts, zoom))
+        draw.line(xy, fill=(255, 255, 255), width=9, joint="curve")
+        draw.line(xy, fill=color, width=5, joint="curve")
+    for (lat, lng, color), xy in zip(markers, to_canvas(marker_pts)):
+        _draw_marker(draw, xy, color)
+    return image
+
+
+def _route_lines(result, route_type):
+    color = ROUTE_COLORS.get(ROUTE_TYPE_ALIASES.get(route_type, route_type), ROUTE_COLORS["walking"])
+    legs = [leg for leg in result.get("legs", []) if leg.get("success")]
+    if legs:
+        palette = [color] + LEG_PALETTE
+        return [(leg.get("map_points") or route_geometry.decode_polyline(leg.get("polyline", "")), palette[i % len(palette)])
+                for i, leg in enumerate(legs)]
+    points = result.get("map_points") or route_geometry.decode_polyline(result.get("polyline", ""))
+    return [(points, color)]
+
+
+def route_image(result, route_type="driving", size=STATIC_MAP_SIZE, tile_loader=load_cached_tile):
+    """根据路线规划结果（process_route / calculate_multi_leg_route 的返回值）绘制路线图"""
+    start_lng, start_lat = map(float, result["origin"].split(','))
+    end_lng, end_lat = map(float, result["destination"].split(','))
+    lines = _route_lines(result, route_type)
+    if all(len(pts) < 2 for pts, _ in lines):
+        lines = [([[start_lat, start_lng], [end_lat, end_lng]], lines[0][1])]
+    markers = [(lat, lng, (24, 144, 255)) for lng, lat, _ in result.get("waypoints", [])[1:-1]]
+    markers += [(start_lat, start_lng, (82, 196, 26)), (end_lat, end_lng, (245, 34, 45))]
+    return render_route(lines, markers, size=size, tile_loader=tile_loader)
+
+
+def to_jpeg_base64(image, quality=JPEG_QUALITY):
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+    return f"data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+
+def route_image_base64(result, route_type="driving", size=STATIC_MAP_SIZE, tile_loader=load_cached_tile):
+    """离线路线图的 JPEG base64（与 save_map_as_image 的返回格式一致）"""
+    return to_jpeg_base64(route_image(result, route_type, size=size, tile_loader=tile_loader))
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+import functools
+
+from cache_store import TTLCache
+
+# 车票查询结果缓存：余票和价格变化较快，只缓存几分钟（秒）
+TICKET_CACHE_TTL = {
+    "flights": int(os.getenv("FLIGHT_CACHE_TTL", 5 * 60)),
+    "trains": int(os.getenv("TRAIN_CACHE_TTL", 5 * 60)),
+}
+TICKET_CACHE_SIZE = int(os.getenv("TICKET_CACHE_SIZE", 512))
+# 等待同一查询的进行中请求的最长时间（秒），超时后自行请求
+TICKET_COALESCE_TIMEOUT = float(os.getenv("TICKET_COALESCE_TIMEOUT", 30))
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+class _Call:
+    """进行中的上游请求，同一查询的并发调用等待它的结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _record(namespace, outcome, elapsed):
+    """outcome: hit / coalesced / upstream / error"""
+    with _metrics_lock:
+        m = _metrics.setdefault(namespace, {
+            "hit": 0, "coalesced": 0, "upstream": 0, "error": 0,
+            "cache_time": 0.0, "wait_time": 0.0, "upstream_time": 0.0, "upstream_max": 0.0,
+        })
+        m[outcome] += 1
+        if outcome == "hit":
+            m["cache_time"] += elapsed
+        elif outcome == "coalesced":
+            m["wait_time"] += elapsed
+        else:
+            m["upstream_time"] += elapsed
+            m["upstream_max"] = max(m["upstream_max"], elapsed)
+
+
+def ticket_metrics():
+    """返回每类查询的命中/合并/上游调用次数，以及缓存命中、等待合并请求与上游调用的平均耗时（毫秒）"""
+    with _metrics_lock:
+        result = {}
+        for namespace, m in _metrics.items():
+            served = m["hit"] + m["coalesced"]
+            upstream = m["upstream"] + m["error"]
+            total = served + upstream
+            result[namespace] = {
+                "requests": total,
+                "hits": m["hit"],
+                "coalesced": m["coalesced"],
+                "upstream_calls": upstream,
+                "upstream_errors": m["error"],
+                "hit_rate": served / total if total else 0.0,
+                "avg_cache_ms": m["cache_time"] / m["hit"] * 1000 if m["hit"] else 0.0,
+                "avg_coalesced_wait_ms": m["wait_time"] / m["coalesced"] * 1000 if m["coalesced"] else 0.0,
+                "avg_upstream_ms": m["upstream_time"] / upstream * 1000 if upstream else 0.0,
+                "max_upstream_ms": m["upstream_max"] * 1000,
+            }
+        return result
+
+
+def ticket_cached(namespace, key_func):
+    """
+    车票查询缓存装饰器：结果按 key_func(*args, **kwargs) 缓存 TICKET_CACHE_TTL[namespace] 秒，
+    同一查询的并发调用只向上游请求一次
+    - key_func 返回 None 时不走缓存（如地名无法解析，由被装饰函数自行处理）
+    - 仅缓存非空结果；接口失败时返回的空列表不缓存，下次重试
+    - 返回结果列表的浅拷贝，调用方可自由增删；上游返回 None 时按空列表处理
+    """
+    cache = TTLCache(max_items=TICKET_CACHE_SIZE, ttl=TICKET_CACHE_TTL[namespace])
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            key = key_func(*args, **kwargs)
+            if key is None:
+                return list(func(*args, **kwargs) or [])
+            inflight_key = (namespace, key)
+            with _inflight_lock:
+                hit, value = cache.get(key)
+                call = None if hit else _inflight.get(inflight_key)
+                owner = not hit and call is None
+                if owner:
+                    call = _inflight[inflight_key] = _Call()
+            if hit:
+                _record(namespace, "hit", time.perf_counter() - start)
+                return list(value)
+            if not owner:
+                if call.event.wait(TICKET_COALESCE_TIMEOUT):
+                    _record(namespace, "coalesced", time.perf_counter() - start)
+                    if call.error is not None:
+                        raise call.error
+                    return list(call.value)
+                print(f"等待进行中的查询超时，重新请求: {namespace} {key}")
+                return list(func(*args, **kwargs) or [])
+
+            try:
+                value = list(func(*args, **kwargs) or [])
+            except Exception as e:
+                call.error = e
+                _record(namespace, "error", time.perf_counter() - start)
+                raise
+            else:
+                call.value = value
+                _record(namespace, "upstream", time.perf_counter() - start)
+                if value:
+                    cache.set(key, value)
+                return list(value)
+            finally:
+                with _inflight_lock:
+                    _inflight.pop(inflight_key, None)
+                call.event.set()
+
+        wrapper.cache = cache
+        wrapper.uncached = func
+        return wrapper
+
+    return decorator
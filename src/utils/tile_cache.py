@@ -0,0 +1,292 @@
+import os
+import math
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+
+# 瓦片缓存目录（{z}/{x}/{y}.png），离线路线图与瓦片代理共用
+CACHE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "temp", "cache"))
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join(CACHE_ROOT, "tiles"))
+STATIC_MAP_CACHE_DIR = os.getenv("STATIC_MAP_CACHE_DIR", os.path.join(CACHE_ROOT, "staticmap"))
+# 瓦片缓存总大小上限（字节），超出后按最近访问时间淘汰到上限的 90%
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# 静态地图图片的有效期（秒）
+STATIC_MAP_TTL = int(os.getenv("STATIC_MAP_TTL", 7 * 24 * 3600))
+# 预取配置：并发数、单次最多预取的瓦片数、排队中的瓦片总数上限（超出的预取请求直接丢弃）
+TILE_PREFETCH_WORKERS = int(os.getenv("TILE_PREFETCH_WORKERS", 8))
+TILE_PREFETCH_MAX_TILES = int(os.getenv("TILE_PREFETCH_MAX_TILES", 400))
+TILE_PREFETCH_MAX_PENDING = int(os.getenv("TILE_PREFETCH_MAX_PENDING", 2000))
+
+# 高德矢量底图瓦片（GCJ-02，与高德接口返回的坐标一致），按 x+y 轮换子域名
+UPSTREAM_TILE_URL = "https://webrd0{s}.is.autonavi.com/appmaptile?lang=zh_cn&size=1&scale=1&style=8&x={x}&y={y}&z={z}"
+STATIC_MAP_URL = "https://restapi.amap.com/v3/staticmap"
+TILE_PROXY_PATH = "/tiles"
+MAX_ZOOM = 18
+
+_size_lock = threading.Lock()
+_evict_lock = threading.Lock()
+_total_bytes = None
+_inflight = {}
+_inflight_lock = threading.Lock()
+# 所有预取共用一个线程池，避免每次生成地图都新建线程
+_prefetch_pool = ThreadPoolExecutor(max_workers=TILE_PREFETCH_WORKERS, thread_name_prefix="tile-prefetch")
+_pending = 0
+_pending_lock = threading.Lock()
+# 代理已注册时为本进程可访问的地址（如 http://127.0.0.1:7860），未启用时为 None
+_proxy_base_url = None
+
+
+def tile_path(z, x, y):
+    return os.path.join(TILE_CACHE_DIR, str(z), str(x), f"{y}.png")
+
+
+def _scan_total_bytes():
+    total = 0
+    for root, _, files in os.walk(TILE_CACHE_DIR):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _account(delta):
+    """更新缓存总大小，超限时触发淘汰"""
+    global _total_bytes
+    with _size_lock:
+        if _total_bytes is None:
+            _total_bytes = _scan_total_bytes()
+        else:
+            _total_bytes += delta
+        over = _total_bytes > TILE_CACHE_MAX_BYTES
+    # 已有线程在淘汰时不重复执行
+    if over and _evict_lock.acquire(blocking=False):
+        try:
+            evict()
+        finally:
+            _evict_lock.release()
+
+
+def evict(target_bytes=None):
+    """按最近访问时间（文件 mtime，读取时刷新）淘汰瓦片，直到总大小不超过 target_bytes"""
+    global _total_bytes
+    target_bytes = int(TILE_CACHE_MAX_BYTES * 0.9) if target_bytes is None else target_bytes
+    entries = []
+    for root, _, files in os.walk(TILE_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= target_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    with _size_lock:
+        _total_bytes = total
+    if removed:
+        print(f"[INFO] 瓦片缓存淘汰 {removed} 个文件，当前 {total / 1024 / 1024:.1f} MB")
+    return removed
+
+
+def read_cached_tile(z, x, y):
+    """只读本地缓存，命中时刷新访问时间；未命中返回 None"""
+    path = tile_path(z, x, y)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return data
+
+
+def _fetch_tile(z, x, y):
+    url = UPSTREAM_TILE_URL.format(s=(x + y) % 4 + 1, x=x, y=y, z=z)
+    response = http_client.get(url, timeout=10)
+    if response.status_code != 200 or not response.content:
+        return None
+    data = response.content
+    path = tile_path(z, x, y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    _account(len(data))
+    return data
+
+
+def get_tile(z, x, y):
+    """
+    取瓦片字节：先查本地缓存，未命中时从高德拉取并落盘
+    同一瓦片的并发请求只向上游发一次
+    """
+    if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return None
+    data = read_cached_tile(z, x, y)
+    if data is not None:
+        return data
+    key = (z, x, y)
+    with _inflight_lock:
+        event = _inflight.get(key)
+        owner = event is None
+        if owner:
+            event = _inflight[key] = threading.Event()
+    if not owner:
+        event.wait(15)
+        return read_cached_tile(z, x, y)
+    try:
+        return _fetch_tile(z, x, y)
+    except Exception as e:
+        print(f"瓦片下载失败 {key}: {e}")
+        return None
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        event.set()
+
+
+def lnglat_to_tile(lng, lat, zoom):
+    lat = max(min(lat, 85.05112878), -85.05112878)
+    n = 2 ** zoom
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_for_bbox(min_lat, min_lng, max_lat, max_lng, zooms):
+    """外接矩形在各缩放级别下覆盖的瓦片 (z, x, y)"""
+    tiles = []
+    for z in zooms:
+        x0, y0 = lnglat_to_tile(min_lng, max_lat, z)
+        x1, y1 = lnglat_to_tile(max_lng, min_lat, z)
+        tiles.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    return tiles
+
+
+def _missing_tiles(points, zooms, max_tiles):
+    lats = [p[0] for p in points]
+    lngs = [p[1] for p in points]
+    tiles = tiles_for_bbox(min(lats), min(lngs), max(lats), max(lngs), zooms)
+    return [t for t in tiles if not os.path.exists(tile_path(*t))][:max_tiles]
+
+
+def _prefetch_tile(tile):
+    global _pending
+    try:
+        return get_tile(*tile)
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+def _submit(tiles):
+    """把瓦片提交到共享线程池，排队总数超过 TILE_PREFETCH_MAX_PENDING 的部分丢弃"""
+    global _pending
+    with _pending_lock:
+        tiles = tiles[:max(TILE_PREFETCH_MAX_PENDING - _pending, 0)]
+        _pending += len(tiles)
+    return [_prefetch_pool.submit(_prefetch_tile, t) for t in tiles]
+
+
+def prefetch(points, zooms, max_tiles=TILE_PREFETCH_MAX_TILES):
+    """
+    预取路线外接矩形在指定缩放级别下的瓦片（已缓存的跳过），等待完成并返回新下载的数量
+    :param points: [[纬度, 经度], ...]
+    """
+    if not len(points):
+        return 0
+    futures = _submit(_missing_tiles(points, zooms, max_tiles))
+    if not futures:
+        return 0
+    start = time.perf_counter()
+    fetched = sum(1 for f in futures if f.result())
+    print(f"[INFO] 瓦片预取: {fetched}/{len(futures)} 个，耗时 {time.perf_counter() - start:.2f}s")
+    return fetched
+
+
+def prefetch_async(points, zooms, max_tiles=TILE_PREFETCH_MAX_TILES):
+    """提交到共享线程池后立即返回（不阻塞地图生成），返回排队的瓦片数"""
+    if not len(points):
+        return 0
+    return len(_submit(_missing_tiles(points, zooms, max_tiles)))
+
+
+def fetch_static_map(api_key, lng, lat, zoom=10, size="600*400"):
+    """
+    高德静态地图（带缓存）：同一位置和参数在 STATIC_MAP_TTL 内只请求一次
+    :return: 图片字节，失败返回 None
+    """
+    params = {
+        "location": f"{lng},{lat}",
+        "zoom": zoom,
+        "size": size,
+        "markers": f"mid,,A:{lng},{lat}",
+    }
+    digest = hashlib.sha1(repr(sorted(params.items())).encode("utf-8")).hexdigest()
+    path = os.path.join(STATIC_MAP_CACHE_DIR, f"{digest}.png")
+    try:
+        if time.time() - os.path.getmtime(path) < STATIC_MAP_TTL:
+            with open(path, "rb") as f:
+                return f.read()
+    except OSError:
+        pass
+    response = http_client.get(STATIC_MAP_URL, params=dict(params, key=api_key))
+    if response.status_code != 200 or not response.headers.get("Content-Type", "").startswith("image"):
+        print(f"静态地图请求失败: HTTP {response.status_code}")
+        return None
+    os.makedirs(STATIC_MAP_CACHE_DIR, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(response.content)
+    return response.content
+
+
+def proxy_enabled():
+    return _proxy_base_url is not None
+
+
+def proxy_base_url():
+    return _proxy_base_url
+
+
+def tile_url_template():
+    """Folium 瓦片地址：代理启用时走本进程（相对路径，与页面同源），否则直连高德"""
+    if proxy_enabled():
+        return TILE_PROXY_PATH + "/{z}/{x}/{y}.png"
+    return UPSTREAM_TILE_URL.replace("{s}", "2")
+
+
+def register_routes(app, base_url):
+    """
+    在 FastAPI 应用上注册瓦片代理路由 GET /tiles/{z}/{x}/{y}.png
+    :param base_url: 本进程可访问的地址，供无头浏览器截图时解析相对路径
+    """
+    global _proxy_base_url
+    from fastapi import Response
+
+    @app.get(TILE_PROXY_PATH + "/{z}/{x}/{y}.png")
+    def tile(z: int, x: int, y: int):
+        data = get_tile(z, x, y)
+        if data is None:
+            return Response(status_code=404)
+        return Response(content=data, media_type="image/png",
+                        headers={"Cache-Control": "public, max-age=86400"})
+
+    _proxy_base_url = base_url.rstrip("/")
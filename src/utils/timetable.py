@@ -0,0 +1,154 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+MINUTES_PER_DAY = 24 * 60
+
+# 火车票各席别的票价字段（接口字段名, 席别）
+TRAIN_PRICE_FIELDS = [
+    ("pricesw", "商务座"),
+    ("pricetd", "特等座"),
+    ("pricegr1", "高级软卧上铺"),
+    ("pricegr2", "高级软卧下铺"),
+    ("pricerw1", "软卧上铺"),
+    ("pricerw2", "软卧下铺"),
+    ("priceyw1", "硬卧上铺"),
+    ("priceyw2", "硬卧中铺"),
+    ("priceyw3", "硬卧下铺"),
+    ("priceyd", "一等座"),
+    ("priceed", "二等座"),
+]
+
+# 各交通方式的接口字段：车次/航班号、出发时间、到达时间（到达时间取 HH:MM）
+MODE_FIELDS = {
+    "train": {"number": "trainno", "departure": "departuretime", "arrival": "arrivaltime"},
+    "flight": {"number": "flightNo", "departure": "planLeaveTime", "arrival": "planArriveTime"},
+}
+
+SORT_KEYS = {
+    "price": ["price", "departure"],
+    "duration": ["duration_min", "departure"],
+    "departure": ["departure"],
+}
+
+TIMETABLE_COLUMNS = ["item", "number", "departure", "arrival", "duration_min", "price"]
+
+
+def field_values(items, key, default=""):
+    """取出一列原始字段（None 视为默认值）"""
+    return [item.get(key) or default for item in items]
+
+
+def hhmm_to_minutes(values):
+    """
+    “HH:MM”（小时可为一位）字符串数组转当天分钟数，无法解析为 NaN
+    按定长 Unicode 数组的码点直接计算，不逐个解析字符串
+    """
+    s = np.char.zfill(np.asarray(values, dtype="U5"), 5)
+    digits = s.view(np.uint32).reshape(len(s), 5).astype(np.int64) - ord("0")
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 3] * 10 + digits[:, 4]
+    valid = (
+        np.all((digits[:, [0, 1, 3, 4]] >= 0) & (digits[:, [0, 1, 3, 4]] <= 9), axis=1)
+        & (digits[:, 2] == ord(":") - ord("0")) & (hours < 24) & (minutes < 60)
+    )
+    return np.where(valid, hours * 60 + minutes, np.nan)
+
+
+def price_matrix(items, fields):
+    """把票价字段转为浮点矩阵（N, len(fields)），空值、“-”、0 均为 NaN"""
+    raw = [item.get(key) for item in items for key, _ in fields]
+    prices = pd.to_numeric(pd.Series(raw, dtype=object), errors="coerce").to_numpy(dtype=float)
+    prices = prices.reshape(len(items), len(fields))
+    return np.where(prices > 0, prices, np.nan)
+
+
+def _offset(base, minutes):
+    """日期 + 分钟数（NaN → NaT）"""
+    result = np.full(len(minutes), np.datetime64("NaT"), dtype="datetime64[m]")
+    ok = ~np.isnan(minutes)
+    result[ok] = base + minutes[ok].astype(np.int64).astype("timedelta64[m]")
+    return result
+
+
+def build_timetable(items, mode, date):
+    """
+    将 query_trains / query_flights 的结果转为列式时刻表
+    到达时间早于出发时间时按次日到达处理
+    :param mode: "train" / "flight"
+    :param date: 出发日期 YYYY-MM-DD
+    :return: DataFrame，列为 item（在 items 中的下标）、number、departure、arrival（Timestamp）、
+             duration_min（分钟）、price（最低票价，无票价为 NaN）
+    """
+    if not items:
+        return pd.DataFrame(columns=TIMETABLE_COLUMNS)
+    fields = MODE_FIELDS[mode]
+    dep_raw = field_values(items, fields["departure"])
+    arr_raw = field_values(items, fields["arrival"])
+    if mode == "flight":
+        # 航班时间为 “YYYY-MM-DD HH:MM:SS”，取时分
+        dep_raw = pd.Series(dep_raw, dtype=str).str.slice(-8, -3)
+        arr_raw = pd.Series(arr_raw, dtype=str).str.slice(-8, -3)
+    dep = hhmm_to_minutes(dep_raw)
+    arr = hhmm_to_minutes(arr_raw)
+    arr = arr + np.where(arr < dep, MINUTES_PER_DAY, 0)
+
+    if mode == "train":
+        with np.errstate(all="ignore"):
+            price = np.fmin.reduce(price_matrix(items, TRAIN_PRICE_FIELDS), axis=1)
+    else:
+        price = price_matrix(items, [("price", "")])[:, 0]
+
+    base = _plan_timestamp(date, "00:00")
+    if base is None:
+        base = np.datetime64("NaT", "m")
+    return pd.DataFrame({
+        "item": np.arange(len(items)),
+        "number": field_values(items, fields["number"]),
+        "departure": _offset(base, dep),
+        "arrival": _offset(base, arr),
+        "duration_min": arr - dep,
+        "price": price,
+    })
+
+
+def _plan_timestamp(date, time):
+    """规划日期时间转 numpy datetime64，无法解析返回 None"""
+    try:
+        return np.datetime64(datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M"), "m")
+    except (TypeError, ValueError):
+        return None
+
+
+def window_mask(table, plan_dep_date, plan_dep_time, plan_arr_date, plan_arr_time):
+    """出发不早于规划出发、到达不晚于规划到达且出发早于到达的班次"""
+    plan_dep = _plan_timestamp(plan_dep_date, plan_dep_time)
+    plan_arr = _plan_timestamp(plan_arr_date, plan_arr_time)
+    if plan_dep is None or plan_arr is None or table.empty:
+        return np.zeros(len(table), dtype=bool)
+    dep = table["departure"].to_numpy()
+    arr = table["arrival"].to_numpy()
+    return (dep >= plan_dep) & (arr <= plan_arr) & (dep < arr)
+
+
+def sort_timetable(table, by="departure"):
+    """按 price / duration / departure 排序（稳定排序，缺失值排在最后）"""
+    keys = [table[col].to_numpy() for col in reversed(SORT_KEYS[by])]
+    return table.iloc[np.lexsort(keys)]
+
+
+def filter_window(table, plan_dep_date, plan_dep_time, plan_arr_date, plan_arr_time, sort_by=None):
+    """筛选规划时间段内的班次，可选排序"""
+    table = table[window_mask(table, plan_dep_date, plan_dep_time, plan_arr_date, plan_arr_time)]
+    return sort_timetable(table, sort_by) if sort_by else table
+
+
+def select_in_window(items, mode, date, plan_dep_time, plan_arr_date, plan_arr_time, sort_by=None):
+    """
+    从接口结果中选出规划时间段内的班次（出发日期即 date）
+    :return: (原始班次 dict 列表, 对应的时刻表)
+    """
+    table = filter_window(build_timetable(items, mode, date), date, plan_dep_time,
+                          plan_arr_date, plan_arr_time, sort_by=sort_by)
+    return [items[i] for i in table["item"].tolist()], table
@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import functools
+from collections import namedtuple
+
+# 交通方式关键词：同时包含两类时按飞机处理
+FLIGHT_KEYWORDS = ("飞机", "航班", "飞")
+TRAIN_KEYWORDS = ("火车", "高铁", "动车")
+
+_DEST_RE = re.compile(r"(前往|到达|抵达)([\u4e00-\u9fa5]+)")
+_DEST_AIRPORT_RE = re.compile(r"抵达([\u4e00-\u9fa5]+机场)")
+_FROM_RE = re.compile(r"从([\u4e00-\u9fa5]+)(机场)?出发")
+_FROM_AIRPORT_RE = re.compile(r"从([\u4e00-\u9fa5]+机场)出发")
+
+# 行程表中的一行（字段缺失时为空字符串），index 为在行程表中的序号
+PlanRow = namedtuple("PlanRow", ["index", "date", "time", "location", "activity", "transport"])
+# 一段行程：mode 为 flight / train / local；next_date/next_time 取下一行，作为规划的到达时间
+TripLeg = namedtuple("TripLeg", [
+    "index", "mode", "date", "time", "start", "end", "transport", "activity",
+    "next_date", "next_time", "prefer_start", "prefer_end",
+])
+
+
+def _parse_line(line):
+    """解析一行 JSON，兼容行尾逗号（伪 JSON 数组格式），无法解析返回 None"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        try:
+            return json.loads(line.rstrip(",").strip())
+        except ValueError:
+            return None
+
+
+def _field(item, key, zh_key):
+    return str(item.get(key, "") or item.get(zh_key, "") or "")
+
+
+def parse_plan(text):
+    """
+    将旅行规划文本解析为 [PlanRow, ...]
+    支持 JSON 数组和每行一个 JSON 对象（JSONL，行尾可带逗号），无法解析的行跳过
+    """
+    items = None
+    if text.lstrip().startswith("["):
+        try:
+            items = json.loads(text)
+        except ValueError:
+            items = None
+    if not isinstance(items, list):
+        items = [_parse_line(line) for line in text.splitlines()]
+    rows = []
+    for item in items:
+        if isinstance(item, dict):
+            rows.append(PlanRow(
+                len(rows),
+                _field(item, "date", "日期"),
+                _field(item, "time", "时间"),
+                _field(item, "location", "地点"),
+                _field(item, "activity", "活动"),
+                _field(item, "transport", "交通"),
+            ))
+    return rows
+
+
+def classify_mode(transport):
+    """按交通方式文本判断 flight / train / local"""
+    if any(k in transport for k in FLIGHT_KEYWORDS):
+        return "flight"
+    if any(k in transport for k in TRAIN_KEYWORDS):
+        return "train"
+    return "local"
+
+
+def _airport_to_city(name):
+    """“北京首都国际机场”这类以“机场”结尾的地名去掉“机场”"""
+    if name and name.endswith("机场"):
+        return name.replace("机场", "")
+    return name
+
+
+def extract_trips(rows):
+    """
+    一次遍历行程表，为每一行生成 TripLeg
+    目的地识别规则：
+    - “前往/到达/抵达XXX” → XXX（“抵达XX机场”同时记为到达机场）
+    - “从XXX出发” → 起点改为 XXX，终点取下一行的地点（“从XX机场出发”同时记为出发机场）
+    - “返程” → 终点为行程表第一行的地点
+    起点或终点缺失时 start/end 均为空字符串，由调用方决定是否跳过
+    """
+    legs = []
+    first_location = rows[0].location if rows else ""
+    for pos, row in enumerate(rows):
+        next_row = rows[pos + 1] if pos + 1 < len(rows) else None
+        start, end = row.location, ""
+        prefer_start = prefer_end = None
+        activity = row.activity
+        m = _DEST_RE.search(activity)
+        if m:
+            end = m.group(2)
+            m_airport = _DEST_AIRPORT_RE.search(activity)
+            if m_airport:
+                prefer_end = m_airport.group(1)
+        else:
+            m_from = _FROM_RE.search(activity)
+            if m_from:
+                start = m_from.group(1)
+                m_airport = _FROM_AIRPORT_RE.search(activity)
+                if m_airport:
+                    prefer_start = m_airport.group(1)
+                end = next_row.location if next_row else ""
+            elif "返程" in activity:
+                end = first_location
+        start, end = _airport_to_city(start), _airport_to_city(end)
+        if not (start and end):
+            start = end = ""
+            prefer_start = prefer_end = None
+
+        next_date, next_time = row.date, ""
+        if next_row is not None and next_row.date:
+            next_date, next_time = next_row.date, next_row.time
+        legs.append(TripLeg(
+            row.index, classify_mode(row.transport), row.date, row.time, start, end,
+            row.transport, activity, next_date, next_time, prefer_start, prefer_end,
+        ))
+    return legs
+
+
+@functools.lru_cache(maxsize=32)
+def _load_plan(plan_path, mtime_ns, size):
+    with open(plan_path, "r", encoding="utf-8") as f:
+        rows = parse_plan(f.read())
+    return tuple(rows), tuple(extract_trips(rows))
+
+
+def load_plan(plan_path):
+    """
+    读取旅行规划文件，返回 (行程表, 每行的 TripLeg)，均为元组
+    按路径和文件修改时间缓存，查票与攻略生成读取同一文件时只解析一次；文件不存在时返回两个空元组
+    """
+    try:
+        st = os.stat(plan_path)
+    except OSError:
+        print(f"未找到旅行规划文件: {plan_path}")
+        return (), ()
+    return _load_plan(os.path.abspath(str(plan_path)), st.st_mtime_ns, st.st_size)
+
+
+def load_legs(plan_path, modes=None):
+    """读取旅行规划中的行程段，modes 指定只保留的交通方式（如 ("flight", "train")）"""
+    _, legs = load_plan(plan_path)
+    return [leg for leg in legs if not modes or leg.mode in modes]